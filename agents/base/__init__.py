@@ -4,10 +4,16 @@
 
 from .agent_interface import AgentInterface, AgentType, AgentMessage, AgentResponse, AgentStatus
 from .base_agent import BaseAgent
+from .model_batcher import ModelBatcher
+from .model_registry import ModelRegistry
+from .runtime_config import AgentRuntimeConfig
 
 __all__ = [
     'AgentInterface',
     'BaseAgent',
+    'ModelBatcher',
+    'ModelRegistry',
+    'AgentRuntimeConfig',
     'AgentType',
     'AgentMessage',
     'AgentResponse',
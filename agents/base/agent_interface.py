@@ -4,9 +4,11 @@
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Optional
-from dataclasses import dataclass
+from typing import Dict, Any, List, Mapping, Optional, Deque
+from dataclasses import dataclass, field
 from enum import Enum
+from collections import deque
+from itertools import islice
 import asyncio
 
 
@@ -32,7 +34,7 @@ class AgentStatus(Enum):
     UNLOADING = "unloading"
 
 
-@dataclass
+@dataclass(slots=True)
 class AgentMessage:
     """智能体消息数据结构"""
     sender_id: str
@@ -41,9 +43,11 @@ class AgentMessage:
     content: Dict[str, Any]
     timestamp: float
     conversation_id: str
+    # 由消息总线在发送时分配，不是构造参数
+    message_id: str = field(default="", init=False)
 
 
-@dataclass
+@dataclass(slots=True)
 class AgentResponse:
     """智能体响应数据结构"""
     agent_id: str
@@ -56,12 +60,16 @@ class AgentResponse:
 class AgentInterface(ABC):
     """智能体基础接口"""
 
-    def __init__(self, agent_id: str, agent_type: AgentType, config: Dict[str, Any]):
+    def __init__(self, agent_id: str, agent_type: AgentType, config: Mapping[str, Any]):
         self.agent_id = agent_id
         self.agent_type = agent_type
+        # 配置为只读映射，同类型的智能体共享同一份，需要修改时请自行复制
         self.config = config
         self.status = AgentStatus.INACTIVE
-        self.conversation_history: List[AgentMessage] = []
+        # 有界队列，超出长度时自动丢弃最早的消息
+        self.conversation_history: Deque[AgentMessage] = deque(
+            maxlen=config.get("max_history_length", 100)
+        )
         self.metadata: Dict[str, Any] = {}
 
     @abstractmethod
@@ -123,15 +131,12 @@ class AgentInterface(ABC):
         """添加消息到历史记录"""
         self.conversation_history.append(message)
 
-        # 保持历史记录在合理范围内
-        if len(self.conversation_history) > self.config.get("max_history_length", 100):
-            self.conversation_history = self.conversation_history[-50:]
-
     def get_conversation_history(self, limit: Optional[int] = None) -> List[AgentMessage]:
         """获取对话历史"""
         if limit:
-            return self.conversation_history[-limit:]
-        return self.conversation_history
+            start = max(0, len(self.conversation_history) - limit)
+            return list(islice(self.conversation_history, start, None))
+        return list(self.conversation_history)
 
     def update_metadata(self, key: str, value: Any):
         """更新元数据"""
@@ -7,67 +7,92 @@ import torch
 import logging
 import time
 import asyncio
-from typing import Dict, Any, Optional
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from typing import Dict, Any, Iterable, Mapping, Optional, Set, Tuple
 from huggingface_hub.hf_api import HfFolder
 
 from .agent_interface import AgentInterface, AgentType, AgentStatus, AgentMessage, AgentResponse
+from .model_batcher import ModelBatcher
+from .model_registry import ModelRegistry
+from .runtime_config import AgentRuntimeConfig
 
 
 class BaseAgent(AgentInterface):
     """智能体基础实现类"""
 
-    def __init__(self, agent_id: str, agent_type: AgentType, config: Dict[str, Any]):
+    def __init__(self, agent_id: str, agent_type: AgentType, config: Mapping[str, Any]):
         super().__init__(agent_id, agent_type, config)
 
+        # 配置只解析一次，之后通过属性访问
+        self.cfg = AgentRuntimeConfig.from_dict(config)
+
         # 模型相关属性
         self.model = None
         self.tokenizer = None
         self.device = None
+        self.batcher: Optional[ModelBatcher] = None
+        # 配置了api_base时使用的OpenAI兼容客户端，由推理服务跨请求做连续批处理
+        self.client = None
+
+        # 静态前缀文本 -> (token, KV缓存)，未启用KV缓存时只保存token
+        self._prefix_cache: Dict[str, Tuple[Any, Any]] = {}
+
+        # 有界收件箱，消息按到达顺序逐条处理
+        self.inbox_size = self.cfg.inbox_size
+        self.inbox: Optional[asyncio.Queue] = None
+        self.enqueue_timeout = self.cfg.enqueue_timeout
+        self.inbox_task: Optional[asyncio.Task] = None
+        self.max_inflight_messages = self.cfg.max_inflight_messages
+        self._inflight_tasks: Set[asyncio.Task] = set()
 
         # 性能监控
         self.total_requests = 0
         self.total_processing_time = 0.0
-        self.last_activity_time = time.time()
+        self.last_activity_time = time.time()  # 对外报告用的绝对时间
+        self._last_activity_monotonic = time.monotonic()  # 空闲判断用，不受系统时钟调整影响
 
         # 日志配置
         self.logger = logging.getLogger(f"Agent.{self.agent_id}")
 
         # 从配置中获取模型参数
-        self.model_id = config.get("model_id")
-        self.cache_dir = config.get("cache_dir", "")
-        self.torch_dtype = getattr(torch, config.get("torch_dtype", "bfloat16"))
-        self.device_map = config.get("device_map", "auto")
-        self.max_new_tokens = config.get("max_new_tokens", 512)
-        self.temperature = config.get("temperature", 0.0)
+        self.model_id = self.cfg.model_id
+        self.cache_dir = self.cfg.cache_dir
+        self.torch_dtype = getattr(torch, self.cfg.torch_dtype)
+        self.device_map = self.cfg.device_map
+        self.max_new_tokens = self.cfg.max_new_tokens
+        self.temperature = self.cfg.temperature
+        self.max_input_length = self.cfg.max_input_length
+        self.quantization = self.cfg.quantization
+        self.attn_impl = self.cfg.attn_impl
+        self.compile_model = self.cfg.compile
+
+        # 相同加载参数的智能体共享同一模型实例
+        self.model_key = ModelRegistry.make_key(
+            self.model_id, self.cfg.torch_dtype, self.device_map,
+            self.quantization, self.attn_impl, self.compile_model
+        )
 
     async def initialize(self) -> bool:
         """初始化智能体"""
         try:
             self.set_status(AgentStatus.LOADING)
-            self.logger.info(f"开始初始化智能体 {self.agent_id}")
+            self.logger.info("开始初始化智能体 %s", self.agent_id)
 
             # 设置HuggingFace token
-            hf_token = self.config.get("hf_token")
+            hf_token = self.cfg.hf_token
             if hf_token:
                 HfFolder.save_token(hf_token)
 
-            # 加载tokenizer
-            self.logger.info(f"加载tokenizer: {self.model_id}")
-            self.tokenizer = AutoTokenizer.from_pretrained(
-                self.model_id,
-                cache_dir=self.cache_dir
-            )
+            if self.cfg.api_base:
+                # 可选依赖，只在使用远程推理服务时导入
+                from openai import AsyncOpenAI
+                self.client = AsyncOpenAI(base_url=self.cfg.api_base, api_key="EMPTY")
 
-            # 加载模型
-            self.logger.info(f"加载模型: {self.model_id}")
-            self.model = AutoModelForCausalLM.from_pretrained(
-                self.model_id,
-                torch_dtype=self.torch_dtype,
-                cache_dir=self.cache_dir,
-                device_map=self.device_map,
-                trust_remote_code=True
-            )
+                self.set_status(AgentStatus.ACTIVE)
+                self.logger.info("智能体 %s 初始化完成，推理服务: %s", self.agent_id, self.cfg.api_base)
+                return True
+
+            # 从注册表获取共享的tokenizer和模型（首次获取时加载）
+            self.tokenizer, self.model = ModelRegistry.acquire(self.model_key, self.cache_dir)
 
             # 获取设备信息
             if hasattr(self.model, 'device'):
@@ -75,23 +100,32 @@ class BaseAgent(AgentInterface):
             else:
                 self.device = next(self.model.parameters()).device
 
+            # 共享同一模型的智能体通过批处理器合并并发生成请求
+            self.batcher = ModelBatcher.acquire(
+                self.model_key, self.model, self.tokenizer, self.device, self.cfg
+            )
+
+            # 预先计算静态前缀的KV缓存（prefill为阻塞调用，放到工作线程中执行）
+            await asyncio.get_running_loop().run_in_executor(None, self._refresh_prefix_cache)
+
             self.set_status(AgentStatus.ACTIVE)
-            self.logger.info(f"智能体 {self.agent_id} 初始化完成，设备: {self.device}")
+            self.logger.info("智能体 %s 初始化完成，设备: %s", self.agent_id, self.device)
             return True
 
         except Exception as e:
-            self.logger.error(f"智能体 {self.agent_id} 初始化失败: {str(e)}")
+            self.logger.error("智能体 %s 初始化失败: %s", self.agent_id, e, exc_info=True)
             self.set_status(AgentStatus.ERROR)
             return False
 
     async def process_message(self, message: AgentMessage) -> AgentResponse:
         """处理消息"""
-        start_time = time.time()
+        start_time = time.perf_counter()
 
         try:
             self.set_status(AgentStatus.PROCESSING)
             self.add_message_to_history(message)
-            self.last_activity_time = start_time
+            self.last_activity_time = time.time()
+            self._last_activity_monotonic = time.monotonic()
 
             # 根据消息类型处理
             if message.message_type == "generate_response":
@@ -102,7 +136,7 @@ class BaseAgent(AgentInterface):
             else:
                 response_text = await self._handle_custom_message(message)
 
-            processing_time = time.time() - start_time
+            processing_time = time.perf_counter() - start_time
             self.total_requests += 1
             self.total_processing_time += processing_time
 
@@ -122,7 +156,7 @@ class BaseAgent(AgentInterface):
             return response
 
         except Exception as e:
-            self.logger.error(f"处理消息时发生错误: {str(e)}")
+            self.logger.error("处理消息时发生错误: %s", e, exc_info=True)
             self.set_status(AgentStatus.ERROR)
 
             return AgentResponse(
@@ -130,57 +164,172 @@ class BaseAgent(AgentInterface):
                 response_text=f"处理消息时发生错误: {str(e)}",
                 confidence=0.0,
                 metadata={"error": str(e), "timestamp": time.time()},
-                processing_time=time.time() - start_time
+                processing_time=time.perf_counter() - start_time
             )
 
+    async def submit_message(self, message: AgentMessage) -> AgentResponse:
+        """将消息放入收件箱，等待处理完成后返回响应"""
+        if self.inbox_task is None or self.inbox_task.done():
+            self.inbox = asyncio.Queue(maxsize=self.inbox_size)
+            self.inbox_task = asyncio.create_task(self._inbox_worker())
+
+        future = asyncio.get_running_loop().create_future()
+        if not await self.enqueue((message, future)):
+            raise RuntimeError(f"智能体 {self.agent_id} 的收件箱已满，消息被丢弃")
+        return await future
+
+    async def enqueue(self, item) -> bool:
+        """放入收件箱：队列未满时直接放入，否则限时等待，超时则丢弃"""
+        try:
+            self.inbox.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        try:
+            await asyncio.wait_for(self.inbox.put(item), self.enqueue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.logger.warning("智能体 %s 的收件箱已满，等待 %ss 后丢弃消息", self.agent_id, self.enqueue_timeout)
+            return False
+
+    async def _inbox_worker(self):
+        """后台任务：取出收件箱中的消息，每条消息作为独立任务处理，同时处理的数量受信号量限制"""
+        semaphore = asyncio.Semaphore(self.max_inflight_messages)
+        while True:
+            # 先占用处理名额再取消息，名额用完时消息留在收件箱中，收件箱满后触发丢弃
+            await semaphore.acquire()
+            try:
+                message, future = await self.inbox.get()
+            except BaseException:
+                semaphore.release()
+                raise
+
+            task = asyncio.create_task(self._process_inbox_item(message, future, semaphore))
+            self._inflight_tasks.add(task)
+            task.add_done_callback(self._inflight_tasks.discard)
+
+    async def _process_inbox_item(self, message: AgentMessage, future: asyncio.Future,
+                                  semaphore: asyncio.Semaphore):
+        """处理一条收件箱消息，并将结果交给等待的调用方"""
+        try:
+            response = await self.process_message(message)
+            if not future.done():
+                future.set_result(response)
+        except asyncio.CancelledError:
+            if not future.done():
+                future.set_exception(RuntimeError(f"智能体 {self.agent_id} 已停止，消息处理被取消"))
+            raise
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        finally:
+            semaphore.release()
+            self.inbox.task_done()
+
+    async def _stop_inbox(self):
+        """停止收件箱任务，取消处理中的消息，并让收件箱中尚未处理的消息失败，避免调用方一直等待"""
+        if self.inbox_task:
+            self.inbox_task.cancel()
+            try:
+                await self.inbox_task
+            except asyncio.CancelledError:
+                pass
+            self.inbox_task = None
+
+        for task in list(self._inflight_tasks):
+            task.cancel()
+        if self._inflight_tasks:
+            await asyncio.gather(*self._inflight_tasks, return_exceptions=True)
+
+        if self.inbox is not None:
+            while not self.inbox.empty():
+                _, future = self.inbox.get_nowait()
+                if not future.done():
+                    future.set_exception(RuntimeError(f"智能体 {self.agent_id} 已停止，消息未处理"))
+            self.inbox = None
+
     async def generate_response(self, prompt: str, context: Dict[str, Any]) -> str:
         """生成回应"""
-        if not self.model or not self.tokenizer:
+        if self.client is None and (not self.model or not self.tokenizer):
             raise RuntimeError(f"智能体 {self.agent_id} 未正确初始化")
 
         try:
-            # 构建完整的输入文本
-            full_prompt = self._build_prompt(prompt, context)
-
-            # Tokenize输入
-            inputs = self.tokenizer(
-                full_prompt,
-                return_tensors="pt",
-                truncation=True,
-                max_length=self.config.get("max_input_length", 2048)
-            ).to(self.device)
-
-            # 生成回应
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    **inputs,
-                    max_new_tokens=self.max_new_tokens,
-                    temperature=self.temperature,
-                    do_sample=self.temperature > 0,
-                    pad_token_id=self.tokenizer.eos_token_id,
-                    eos_token_id=self.tokenizer.eos_token_id
+            # 拆分为静态前缀和动态部分，动态内容始终位于末尾
+            prefix, full_prompt = self._split_prompt(prompt, context)
+
+            if self.client is not None:
+                # 与本地生成一样直接续写原始prompt；静态前缀由服务端的前缀缓存复用
+                completion = await self.client.completions.create(
+                    model=self.model_id,
+                    prompt=prefix + full_prompt,
+                    max_tokens=self.max_new_tokens,
+                    temperature=self.temperature
                 )
-
-            # 解码输出
-            response = self.tokenizer.decode(
-                outputs[0][inputs.input_ids.shape[1]:],
-                skip_special_tokens=True
-            ).strip()
+                return completion.choices[0].text.strip()
+
+            max_length = self.max_input_length
+            gen_kwargs = {
+                "max_new_tokens": self.max_new_tokens,
+                "temperature": self.temperature,
+                "do_sample": self.temperature > 0,
+                "use_cache": True,
+                "eos_token_id": self.tokenizer.eos_token_id
+            }
+
+            cached = self._prefix_cache.get(prefix)
+            if cached is not None:
+                # 整个prompt一次tokenize，分段tokenize时BPE在前缀边界处的合并会与整体编码不同
+                prefix_ids, prefix_kv = cached
+                input_ids = self.tokenizer(
+                    prefix + full_prompt,
+                    return_tensors="pt",
+                    truncation=True,
+                    max_length=max_length
+                ).input_ids.to(self.device)
+
+                # 只有前缀token恰好是整体编码的前缀时才能复用预先计算的token和KV缓存
+                if self._starts_with(input_ids, prefix_ids):
+                    return await self.batcher.submit_cached(input_ids, prefix_kv, gen_kwargs)
+
+            # 提交到批处理器，与其他智能体的并发请求合并生成
+            response = await self.batcher.submit(
+                prefix + full_prompt,
+                gen_kwargs,
+                max_length
+            )
 
             return response
 
         except Exception as e:
-            self.logger.error(f"生成回应时发生错误: {str(e)}")
+            self.logger.error("生成回应时发生错误: %s", e, exc_info=True)
             raise
 
     async def cleanup(self) -> bool:
         """清理资源"""
         try:
             self.set_status(AgentStatus.UNLOADING)
-            self.logger.info(f"开始清理智能体 {self.agent_id}")
+            self.logger.info("开始清理智能体 %s", self.agent_id)
 
-            # 清理模型
+            # 停止收件箱任务
+            await self._stop_inbox()
+
+            # 清理前缀缓存
+            self._prefix_cache.clear()
+
+            # 关闭推理服务客户端
+            if self.client is not None:
+                await self.client.close()
+                self.client = None
+
+            # 释放批处理器
+            if self.batcher:
+                await ModelBatcher.release(self.model_key)
+                self.batcher = None
+
+            # 清理模型（其他智能体仍在使用时只释放引用）
             if self.model:
+                ModelRegistry.release(self.model_key)
                 del self.model
                 self.model = None
 
@@ -191,14 +340,15 @@ class BaseAgent(AgentInterface):
 
             # 清理GPU缓存
             if torch.cuda.is_available():
-                torch.cuda.empty_cache()
+                # empty_cache会同步设备，放到工作线程中执行，避免阻塞事件循环
+                await asyncio.get_running_loop().run_in_executor(None, torch.cuda.empty_cache)
 
             self.set_status(AgentStatus.INACTIVE)
-            self.logger.info(f"智能体 {self.agent_id} 清理完成")
+            self.logger.info("智能体 %s 清理完成", self.agent_id)
             return True
 
         except Exception as e:
-            self.logger.error(f"清理智能体 {self.agent_id} 时发生错误: {str(e)}")
+            self.logger.error("清理智能体 %s 时发生错误: %s", self.agent_id, e, exc_info=True)
             self.set_status(AgentStatus.ERROR)
             return False
 
@@ -207,6 +357,50 @@ class BaseAgent(AgentInterface):
         # 子类可以重写此方法来自定义prompt构建逻辑
         return prompt
 
+    def _get_system_prefix(self) -> str:
+        """获取每次生成都相同的静态前缀，子类可以重写"""
+        return ""
+
+    def _split_prompt(self, prompt: str, context: Dict[str, Any]) -> Tuple[str, str]:
+        """将输入拆分为 (静态前缀, 动态部分)，子类可以按阶段返回不同的静态前缀"""
+        return self._get_system_prefix(), self._build_prompt(prompt, context)
+
+    def _get_static_prefixes(self) -> Iterable[str]:
+        """获取需要预先计算缓存的所有静态前缀，应覆盖_split_prompt可能返回的前缀"""
+        return [self._get_system_prefix()]
+
+    @staticmethod
+    def _starts_with(input_ids, prefix_ids) -> bool:
+        """判断prefix_ids是否为input_ids的真前缀（均为batch大小为1的token张量）"""
+        # 前缀KV缓存之后至少要留一个token做prefill，截断到只剩前缀时不复用
+        prefix_length = prefix_ids.shape[1]
+        if input_ids.shape[1] <= prefix_length:
+            return False
+        return input_ids[0, :prefix_length].tolist() == prefix_ids[0].tolist()
+
+    def _refresh_prefix_cache(self):
+        """重新计算静态前缀的token及KV缓存，前缀或配置变化后需要调用"""
+        self._prefix_cache.clear()
+
+        for prefix in self._get_static_prefixes():
+            if not prefix or prefix in self._prefix_cache:
+                continue
+
+            prefix_ids = self.tokenizer(prefix, return_tensors="pt").input_ids.to(self.device)
+            prefix_kv = None
+            # 编译后的模型（model_key[5]）使用静态KV缓存生成，不能传入预先计算的动态缓存
+            if self.cfg.prefix_kv_cache and not self.model_key[5]:
+                with torch.inference_mode():
+                    prefix_kv = self.model(input_ids=prefix_ids, use_cache=True).past_key_values
+
+            self._prefix_cache[prefix] = (prefix_ids, prefix_kv)
+
+        if self._prefix_cache:
+            self.logger.info(
+                "静态前缀缓存已就绪，前缀数: %d，是否缓存KV: %s",
+                len(self._prefix_cache), self.cfg.prefix_kv_cache
+            )
+
     async def _handle_custom_message(self, message: AgentMessage) -> str:
         """处理自定义消息类型"""
         # 子类可以重写此方法来处理特定的消息类型
@@ -237,4 +431,4 @@ class BaseAgent(AgentInterface):
 
     def is_idle(self, idle_threshold: float = 300.0) -> bool:
         """判断智能体是否空闲"""
-        return (time.time() - self.last_activity_time) > idle_threshold
\ No newline at end of file
+        return (time.monotonic() - self._last_activity_monotonic) > idle_threshold
\ No newline at end of file
@@ -0,0 +1,282 @@
+"""
+模型批处理器
+将共享同一模型的多个智能体的并发生成请求合并为一个批次，提升GPU利用率
+"""
+
+import asyncio
+import copy
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
+
+import torch
+
+from .model_registry import ModelKey
+from .runtime_config import AgentRuntimeConfig
+
+
+@dataclass
+class BatchRequest:
+    """单个生成请求"""
+    prompt: str
+    gen_kwargs: Dict[str, Any]
+    max_length: int
+    future: asyncio.Future
+    input_ids: Any = None  # 预先编码的输入（带前缀KV缓存的请求）
+    past_key_values: Any = None
+
+
+class ModelBatcher:
+    """模型批处理器，在共享同一模型实例的智能体之间共享"""
+
+    _instances: Dict[ModelKey, "ModelBatcher"] = {}
+
+    def __init__(self, key: ModelKey, model, tokenizer, device,
+                 max_batch_size: int = 8, max_wait_ms: float = 50.0,
+                 pad_to_multiple_of: Optional[int] = None):
+        self.key = key
+        self.model_id = key[0]
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        # 将输入长度对齐到固定的桶大小，减少编译后的模型遇到新形状时的重新编译
+        self.pad_to_multiple_of = pad_to_multiple_of
+        self.logger = logging.getLogger(f"ModelBatcher.{self.model_id}")
+
+        # 编译后的模型（key[5]）使用静态KV缓存，避免DynamicCache导致每步重新编译；
+        # CUDA graph只能在录制它的线程中重放，所有生成调用都放到同一个专用线程中执行
+        self.cache_kwargs = {"cache_implementation": "static"} if key[5] else {}
+        self.executor = (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"generate-{self.model_id}")
+            if key[5] else None
+        )
+
+        # 批量生成需要左填充，保证所有prompt的末尾对齐
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker_task: Optional[asyncio.Task] = None
+        self.ref_count = 0
+
+    @classmethod
+    def acquire(cls, key: ModelKey, model, tokenizer, device, cfg: AgentRuntimeConfig) -> "ModelBatcher":
+        """获取（或创建）指定模型的批处理器"""
+        batcher = cls._instances.get(key)
+        if batcher is None:
+            batcher = cls(
+                key, model, tokenizer, device,
+                max_batch_size=cfg.max_batch_size,
+                max_wait_ms=cfg.max_wait_ms,
+                # 编译后的模型（key[5]）默认按64对齐输入长度
+                pad_to_multiple_of=cfg.pad_to_multiple_of or (64 if key[5] else None)
+            )
+            cls._instances[key] = batcher
+        batcher.ref_count += 1
+        return batcher
+
+    @classmethod
+    async def release(cls, key: ModelKey):
+        """释放批处理器引用，引用计数归零时停止后台任务"""
+        batcher = cls._instances.get(key)
+        if batcher is None:
+            return
+
+        batcher.ref_count -= 1
+        if batcher.ref_count <= 0:
+            del cls._instances[key]
+            await batcher.stop()
+            if batcher.executor is not None:
+                batcher.executor.shutdown(wait=False)
+
+    async def submit(self, prompt: str, gen_kwargs: Dict[str, Any], max_length: int) -> str:
+        """提交生成请求，等待批处理完成后返回生成文本"""
+        return await self._enqueue(BatchRequest(
+            prompt, gen_kwargs, max_length, asyncio.get_running_loop().create_future()
+        ))
+
+    async def submit_cached(self, input_ids, past_key_values, gen_kwargs: Dict[str, Any]) -> str:
+        """提交预先编码的生成请求，past_key_values（可为None）必须恰好对应input_ids的某个真前缀"""
+        return await self._enqueue(BatchRequest(
+            "", gen_kwargs, input_ids.shape[1], asyncio.get_running_loop().create_future(),
+            input_ids=input_ids, past_key_values=past_key_values
+        ))
+
+    async def _enqueue(self, request: BatchRequest) -> str:
+        """将请求放入队列，必要时启动后台任务"""
+        if self.worker_task is None or self.worker_task.done():
+            self.queue = asyncio.Queue()
+            self.worker_task = asyncio.create_task(self._worker())
+
+        await self.queue.put(request)
+        return await request.future
+
+    async def stop(self):
+        """停止后台批处理任务，仍在队列中或正在处理的请求以异常结束，调用方不会一直等待"""
+        if self.worker_task:
+            self.worker_task.cancel()
+            try:
+                await self.worker_task
+            except asyncio.CancelledError:
+                pass
+            self.worker_task = None
+
+        if self.queue is not None:
+            while not self.queue.empty():
+                self._fail_stopped(self.queue.get_nowait())
+
+    def _fail_stopped(self, request: BatchRequest):
+        """批处理器停止时结束未完成的请求"""
+        if not request.future.done():
+            request.future.set_exception(RuntimeError(f"模型批处理器 {self.model_id} 已停止，请求未处理"))
+
+    async def _worker(self):
+        """后台任务：收集请求直到达到批大小或等待超时，然后统一生成"""
+        loop = asyncio.get_running_loop()
+        batch: List[BatchRequest] = []
+
+        try:
+            while True:
+                batch = [await self.queue.get()]
+                deadline = loop.time() + self.max_wait
+
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                # 生成参数不同的请求不能放在同一批次中，预先编码的请求与文本请求分开分组
+                groups: Dict[tuple, List[BatchRequest]] = {}
+                for request in batch:
+                    pre_encoded = request.input_ids is not None
+                    key = (pre_encoded, None if pre_encoded else request.max_length,
+                           tuple(sorted((k, repr(v)) for k, v in request.gen_kwargs.items())))
+                    groups.setdefault(key, []).append(request)
+
+                for (pre_encoded, _, _), group in groups.items():
+                    if not pre_encoded:
+                        await self._process_batch(group)
+                    elif len(group) == 1:
+                        # 单个请求复用前缀KV缓存，只需对前缀之后的token做prefill
+                        await self._process_cached(group[0])
+                    else:
+                        # 多个智能体的预编码请求合并为一次generate，批量prefill比逐个复用缓存更快
+                        await self._process_batch(group, self._generate_encoded_batch)
+        except asyncio.CancelledError:
+            # 已从队列取出但尚未完成的请求随批处理器一起结束
+            for request in batch:
+                self._fail_stopped(request)
+            raise
+
+    async def _process_batch(self, batch: List[BatchRequest], generate=None):
+        """对一个批次执行一次padding后的generate调用，并将结果分发回各请求"""
+        try:
+            # generate是阻塞调用，放到工作线程中执行，避免阻塞事件循环
+            texts = await asyncio.get_running_loop().run_in_executor(
+                self.executor, generate or self._generate_batch, batch
+            )
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("批量生成完成，批大小: %d", len(batch))
+
+            for request, text in zip(batch, texts):
+                if not request.future.done():
+                    request.future.set_result(text.strip())
+
+        except Exception as e:
+            self.logger.error("批量生成时发生错误: %s", e, exc_info=True)
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+
+    async def _process_cached(self, request: BatchRequest):
+        """复用前缀KV缓存生成，只需对前缀之后的token做prefill"""
+        try:
+            text = await asyncio.get_running_loop().run_in_executor(self.executor, self._generate_cached, request)
+            if not request.future.done():
+                request.future.set_result(text.strip())
+
+        except Exception as e:
+            self.logger.error("前缀缓存生成时发生错误: %s", e, exc_info=True)
+            if not request.future.done():
+                request.future.set_exception(e)
+
+    def _generate_batch(self, batch: List[BatchRequest]) -> List[str]:
+        """同步执行批量tokenize、生成和解码（在工作线程中运行）"""
+        inputs = self.tokenizer(
+            [request.prompt for request in batch],
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=batch[0].max_length,
+            pad_to_multiple_of=self.pad_to_multiple_of
+        ).to(self.device)
+
+        with torch.inference_mode():
+            outputs = self.model.generate(
+                **inputs,
+                **batch[0].gen_kwargs,
+                **self.cache_kwargs,
+                pad_token_id=self.tokenizer.pad_token_id
+            )
+
+        # 左填充后所有prompt长度一致，按输入长度切分出新生成的部分
+        prompt_length = inputs.input_ids.shape[1]
+        return self.tokenizer.batch_decode(
+            outputs[:, prompt_length:],
+            skip_special_tokens=True
+        )
+
+    def _generate_encoded_batch(self, batch: List[BatchRequest]) -> List[str]:
+        """将预先编码的多个请求左填充后批量生成（在工作线程中运行），不使用前缀KV缓存"""
+        pad_token_id = self.tokenizer.pad_token_id
+        target_length = max(request.input_ids.shape[1] for request in batch)
+        if self.pad_to_multiple_of:
+            target_length = -(-target_length // self.pad_to_multiple_of) * self.pad_to_multiple_of
+
+        rows, masks = [], []
+        for request in batch:
+            input_ids = request.input_ids
+            padding = target_length - input_ids.shape[1]
+            rows.append(torch.cat([input_ids.new_full((1, padding), pad_token_id), input_ids], dim=-1))
+            masks.append(torch.cat([input_ids.new_zeros((1, padding)), torch.ones_like(input_ids)], dim=-1))
+
+        with torch.inference_mode():
+            outputs = self.model.generate(
+                input_ids=torch.cat(rows, dim=0),
+                attention_mask=torch.cat(masks, dim=0),
+                **batch[0].gen_kwargs,
+                **self.cache_kwargs,
+                pad_token_id=pad_token_id
+            )
+
+        return self.tokenizer.batch_decode(
+            outputs[:, target_length:],
+            skip_special_tokens=True
+        )
+
+    def _generate_cached(self, request: BatchRequest) -> str:
+        """同步执行带前缀缓存的生成和解码（在工作线程中运行）"""
+        input_ids = request.input_ids
+        with torch.inference_mode():
+            outputs = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                # generate会原地扩展缓存，每次使用副本保持前缀缓存不变
+                past_key_values=copy.deepcopy(request.past_key_values),
+                **request.gen_kwargs,
+                **self.cache_kwargs,
+                pad_token_id=self.tokenizer.pad_token_id
+            )
+
+        return self.tokenizer.decode(
+            outputs[0][input_ids.shape[1]:],
+            skip_special_tokens=True
+        )
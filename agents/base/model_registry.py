@@ -0,0 +1,122 @@
+"""
+模型注册表
+在进程内共享相同配置的模型和tokenizer实例，避免多个智能体重复加载同一模型
+"""
+
+import importlib.util
+import logging
+import os
+from typing import Dict, Any, Tuple
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+
+
+# (model_id, torch_dtype, device_map, quantization, attn_impl, compile_model)
+ModelKey = Tuple[str, str, str, str, str, bool]
+
+
+class ModelRegistry:
+    """进程级模型注册表，按引用计数管理模型生命周期"""
+
+    _models: Dict[ModelKey, Tuple[Any, Any]] = {}
+    _ref_counts: Dict[ModelKey, int] = {}
+    logger = logging.getLogger("ModelRegistry")
+
+    @classmethod
+    def make_key(cls, model_id: str, torch_dtype: str, device_map: str, quantization: str = "bf16",
+                 attn_impl: str = "auto", compile_model: bool = False) -> ModelKey:
+        """构建模型缓存键"""
+        return (model_id, torch_dtype, device_map, quantization, cls._resolve_attn_impl(attn_impl),
+                compile_model and torch.cuda.is_available())
+
+    @staticmethod
+    def _resolve_attn_impl(attn_impl: str) -> str:
+        """解析注意力实现，auto时优先使用FlashAttention2，未安装则使用SDPA"""
+        if attn_impl != "auto":
+            return attn_impl
+        if importlib.util.find_spec("flash_attn") is not None:
+            return "flash_attention_2"
+        return "sdpa"
+
+    @staticmethod
+    def _build_quantization_kwargs(torch_dtype: str, quantization: str) -> Dict[str, Any]:
+        """根据量化方式构建from_pretrained的参数"""
+        if quantization == "nf4":
+            from transformers import BitsAndBytesConfig
+            return {
+                "quantization_config": BitsAndBytesConfig(
+                    load_in_4bit=True,
+                    bnb_4bit_compute_dtype=torch.bfloat16,
+                    bnb_4bit_quant_type="nf4"
+                )
+            }
+        elif quantization == "int8":
+            from transformers import BitsAndBytesConfig
+            return {"quantization_config": BitsAndBytesConfig(load_in_8bit=True)}
+        else:
+            return {"torch_dtype": getattr(torch, torch_dtype)}
+
+    @classmethod
+    def acquire(cls, key: ModelKey, cache_dir: str = "") -> Tuple[Any, Any]:
+        """获取共享的 (tokenizer, model)，首次获取时从磁盘加载"""
+        if key not in cls._models:
+            model_id, torch_dtype, device_map, quantization, attn_impl, compile_model = key
+
+            # model_id为本地目录时直接从磁盘加载，跳过Hub的解析请求
+            local_files_only = os.path.isdir(model_id)
+
+            cls.logger.info("加载tokenizer: %s", model_id)
+            tokenizer = AutoTokenizer.from_pretrained(
+                model_id,
+                cache_dir=cache_dir,
+                local_files_only=local_files_only
+            )
+
+            cls.logger.info("加载模型: %s（量化方式: %s，注意力实现: %s）", model_id, quantization, attn_impl)
+            model = AutoModelForCausalLM.from_pretrained(
+                model_id,
+                cache_dir=cache_dir,
+                local_files_only=local_files_only,
+                # safetensors权重通过内存映射直接加载，避免在CPU内存中完整复制一份
+                low_cpu_mem_usage=True,
+                device_map=device_map,
+                trust_remote_code=True,
+                attn_implementation=attn_impl,
+                **cls._build_quantization_kwargs(torch_dtype, quantization)
+            )
+            model.eval()
+
+            if compile_model:
+                # 只编译forward，generate仍走原有的解码循环；CUDA graph要求输入形状稳定，
+                # 生成时由ModelBatcher使用静态KV缓存并在单个线程中调用
+                cls.logger.info("使用torch.compile编译模型: %s", model_id)
+                model.forward = torch.compile(model.forward, mode="reduce-overhead", dynamic=False)
+
+            cls._models[key] = (tokenizer, model)
+            cls._ref_counts[key] = 0
+        else:
+            cls.logger.info("复用已加载的模型: %s", key[0])
+
+        cls._ref_counts[key] += 1
+        return cls._models[key]
+
+    @classmethod
+    def release(cls, key: ModelKey) -> bool:
+        """释放模型引用，引用计数归零时从注册表移除，返回是否已移除"""
+        if key not in cls._ref_counts:
+            return False
+
+        cls._ref_counts[key] -= 1
+        if cls._ref_counts[key] > 0:
+            return False
+
+        del cls._ref_counts[key]
+        del cls._models[key]
+        cls.logger.info("模型已从注册表移除: %s", key[0])
+        return True
+
+    @classmethod
+    def get_ref_count(cls, key: ModelKey) -> int:
+        """获取模型当前的引用计数"""
+        return cls._ref_counts.get(key, 0)
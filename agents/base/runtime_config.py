@@ -0,0 +1,36 @@
+"""
+智能体运行时配置
+在智能体构造时将配置字典解析为只读结构，热路径上直接读取属性而不再查字典
+"""
+
+from dataclasses import dataclass, fields
+from typing import Dict, Any, Optional
+
+
+@dataclass(frozen=True)
+class AgentRuntimeConfig:
+    """BaseAgent使用的类型化配置，未列出的键仍保留在原始配置字典中"""
+    model_id: Optional[str] = None
+    api_base: str = ""  # OpenAI兼容推理服务地址，非空时通过HTTP生成而不在本进程加载模型
+    cache_dir: str = ""
+    hf_token: str = ""
+    torch_dtype: str = "bfloat16"
+    device_map: str = "auto"
+    max_new_tokens: int = 512
+    temperature: float = 0.0
+    max_input_length: int = 2048
+    quantization: str = "bf16"  # bf16 / nf4 / int8
+    attn_impl: str = "auto"  # auto / flash_attention_2 / sdpa / eager
+    compile: bool = False
+    prefix_kv_cache: bool = True
+    max_batch_size: int = 8
+    max_wait_ms: float = 50.0
+    pad_to_multiple_of: Optional[int] = None
+    inbox_size: int = 128
+    max_inflight_messages: int = 8  # 同时处理的收件箱消息数，并发的生成请求才能被批处理器合并
+    enqueue_timeout: float = 0.25
+
+    @classmethod
+    def from_dict(cls, config: Dict[str, Any]) -> "AgentRuntimeConfig":
+        """从配置字典中提取已知字段，忽略其他键"""
+        return cls(**{f.name: config[f.name] for f in fields(cls) if f.name in config})
@@ -4,26 +4,316 @@
 """
 
 import re
-from typing import Dict, Any, List
+import string
+from functools import lru_cache, partial
+from types import MappingProxyType
+from typing import Dict, Any, FrozenSet, Iterable, Mapping, Optional, Sequence, Tuple
 from ..base.base_agent import BaseAgent
 from ..base.agent_interface import AgentType, AgentMessage
+from ..utils.response_cache import ResponseCache
+
+try:
+    import ahocorasick
+except ImportError:  # 未安装pyahocorasick时退回正则扫描
+    ahocorasick = None
+
+
+# 各阶段的默认prompt模板，配置中未提供对应模板时使用
+# 文化身份和文化背景放在最前面，随场景变化的字段都在其后，使文化背景落在可缓存的静态前缀中
+_DEFAULT_PROMPT_TEMPLATES = {
+    "initial_decision": """
+作为{cultural_background}文化的代表：
+
+文化背景: {cultural_context}
+
+请评估以下行为在{country}是否社会可接受。
+
+规则参考: {rule_of_thumb}
+场景描述: {story}
+
+请基于你的文化价值观和对{country}文化的理解，回答这个行为是否可接受。
+回答格式：Yes/No/Neither，然后用不超过3句话解释你的理由。
+
+回答：""",
+    "feedback": """
+作为{cultural_background}文化的代表：
+
+文化背景: {cultural_context}
+
+你正在与其他文化背景的讨论者讨论以下场景在{country}的社会可接受性。
+
+规则参考: {rule_of_thumb}
+场景描述: {story}
+
+你的观点: {your_response}
+对方观点: {other_response}
+
+请基于你的文化价值观，对对方的观点提供反馈。用不超过3句话回应。
+
+反馈：""",
+    "final_decision": """
+作为{cultural_background}文化的代表：
+
+文化背景: {cultural_context}
+
+基于以下完整讨论，请做出最终决策。
+
+规则参考: {rule_of_thumb}
+场景描述: {story}
+
+讨论过程：
+你的初始观点: {your_response}
+对方初始观点: {other_response}
+你的反馈: {your_feedback}
+对方反馈: {other_feedback}
+
+请综合考虑讨论内容和你的文化价值观，做出最终判断。
+只需回答：Yes、No 或 Neither
+
+最终答案："""
+}
+
+
+@lru_cache(maxsize=4096)
+def normalize_text(text: str) -> str:
+    """统一大小写用于关键词匹配，重复出现的场景文本直接命中缓存"""
+    return text.casefold()
+
+
+def compile_keywords(*keywords: str) -> "re.Pattern[str]":
+    """将关键词编译为一个正则多选分支，一次扫描即可完成匹配"""
+    # 较长的关键词放在前面，避免被其前缀关键词抢先匹配
+    ordered = sorted(set(keywords), key=len, reverse=True)
+    return re.compile("|".join(map(re.escape, ordered)))
+
+
+def count_keywords(pattern: "re.Pattern[str]", text: str) -> int:
+    """统计文本中出现的不同关键词个数"""
+    return len(set(pattern.findall(text)))
+
+
+# 回答中的Yes/No/Neither；ASCII模式下紧邻的中文字符也算作单词边界
+_ANSWER_PATTERN = re.compile(r"\b(yes|no|neither)\b", re.IGNORECASE | re.ASCII)
+
+# 带“Answer:”或“答案：”标签的答案，优先于正文中出现的Yes/No/Neither
+_LABELLED_ANSWER_PATTERN = re.compile(r"(?:answer|答案|回答)\s*[:：][\s*]*(yes|no|neither)\b", re.IGNORECASE | re.ASCII)
+
+# 没有标签时，同时出现多个答案按 yes > no > neither 的优先级选取
+_ANSWER_PRECEDENCE = ("yes", "no", "neither")
+
+
+def find_answer(text: str) -> Optional[str]:
+    """提取文本中的答案：标签后的答案优先，其次按优先级选取正文中的答案，都没有时返回None"""
+    match = _LABELLED_ANSWER_PATTERN.search(text)
+    if match:
+        return match.group(1).lower()
+    found = {word.lower() for word in _ANSWER_PATTERN.findall(text)}
+    return next((answer for answer in _ANSWER_PRECEDENCE if answer in found), None)
+
+
+# 文化之间的相似度，未列出的组合使用默认值
+_DEFAULT_SIMILARITY = 0.1
+_SIMILARITY_PAIRS = {
+    (AgentType.CULTURAL_CHRISTIAN, AgentType.CULTURAL_BUDDHIST): 0.3,
+    (AgentType.CULTURAL_CHRISTIAN, AgentType.CULTURAL_HINDU): 0.2,
+    (AgentType.CULTURAL_CHRISTIAN, AgentType.CULTURAL_ISLAMIC): 0.4,
+    (AgentType.CULTURAL_CHRISTIAN, AgentType.CULTURAL_TRADITIONAL): 0.1,
+    (AgentType.CULTURAL_ISLAMIC, AgentType.CULTURAL_HINDU): 0.3,
+    (AgentType.CULTURAL_ISLAMIC, AgentType.CULTURAL_BUDDHIST): 0.2,
+    (AgentType.CULTURAL_ISLAMIC, AgentType.CULTURAL_TRADITIONAL): 0.2,
+    (AgentType.CULTURAL_BUDDHIST, AgentType.CULTURAL_HINDU): 0.6,
+    (AgentType.CULTURAL_BUDDHIST, AgentType.CULTURAL_TRADITIONAL): 0.4,
+    (AgentType.CULTURAL_HINDU, AgentType.CULTURAL_TRADITIONAL): 0.3,
+}
+
+# 导入时展开为对称表，查询时只需一次字典查找
+_CULTURAL_SIMILARITY: Dict[Tuple[AgentType, AgentType], float] = {}
+for (_a, _b), _value in _SIMILARITY_PAIRS.items():
+    _CULTURAL_SIMILARITY[(_a, _b)] = _CULTURAL_SIMILARITY[(_b, _a)] = _value
+del _a, _b, _value
+
+
+def partial_format(template: str, **values: Any) -> str:
+    """只替换给定的字段，其余占位符原样保留，结果仍可继续format"""
+    parts = []
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        parts.append(literal.replace("{", "{{").replace("}", "}}"))
+        if field is None:
+            continue
+        if field in values and not spec and not conversion:
+            parts.append(str(values[field]).replace("{", "{{").replace("}", "}}"))
+        else:
+            parts.append("{%s%s%s}" % (field, "!" + conversion if conversion else "", ":" + spec if spec else ""))
+    return "".join(parts)
+
+
+def split_static_prefix(template: str) -> Tuple[str, str]:
+    """在第一个占位符处拆分模板，返回 (不含占位符的静态前缀, 其余仍可format的部分)"""
+    literals = []
+    raw_length = 0
+    # 转义的花括号会让parse拆出多段文本，逐段累加直到遇到第一个字段
+    for literal, field, _, _ in string.Formatter().parse(template):
+        literals.append(literal)
+        # parse返回的是去掉转义后的文本，还原转义后即为其在模板中的长度
+        raw_length += len(literal.replace("{", "{{").replace("}", "}}"))
+        if field is not None:
+            return "".join(literals), template[raw_length:]
+    return "".join(literals), ""
+
+
+def _value_importance(value_lower: str, values_lower: FrozenSet[str], norms_lower: Sequence[str]) -> str:
+    """价值观属于核心价值观为高，出现在社会规范中为中，否则为低"""
+    if value_lower in values_lower:
+        return "高"
+    if any(value_lower in norm for norm in norms_lower):
+        return "中"
+    return "低"
+
+
+class KeywordScanner:
+    """按类别汇总关键词，一次扫描即可得出文本命中的所有类别"""
+
+    def __init__(self, categories: Mapping[str, Iterable[str]], cache_size: int = 256):
+        # 每个扫描器（即每个智能体类）各自缓存扫描结果，同一会话中重复的场景不再重新扫描
+        self.scan = lru_cache(maxsize=cache_size)(self._scan)
+
+        keyword_categories: Dict[str, set] = {}
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                keyword_categories.setdefault(keyword, set()).add(category)
+
+        if ahocorasick is not None:
+            # Aho-Corasick自动机一次遍历即可报告所有（包括相互重叠的）关键词
+            self._automaton = ahocorasick.Automaton()
+            for keyword, categories_ in keyword_categories.items():
+                self._automaton.add_word(keyword, frozenset(categories_))
+            self._automaton.make_automaton()
+            return
+
+        self._automaton = None
+        # 零宽前瞻在每个位置报告最长的匹配，因此重叠的关键词也都能被找到
+        ordered = sorted(keyword_categories, key=len, reverse=True)
+        self._pattern = re.compile("(?=(%s))" % "|".join(map(re.escape, ordered)))
+
+        # 同一位置较短的关键词一定是最长匹配的前缀，预先把它们的类别合并进来
+        self._labels: Dict[str, FrozenSet[str]] = {
+            keyword: frozenset(
+                category
+                for prefix, prefix_categories in keyword_categories.items()
+                if keyword.startswith(prefix)
+                for category in prefix_categories
+            )
+            for keyword in keyword_categories
+        }
+
+    def _scan(self, text: str) -> FrozenSet[str]:
+        """返回文本中出现的关键词所属的全部类别"""
+        hits: set = set()
+        if self._automaton is not None:
+            for _, labels in self._automaton.iter(text):
+                hits |= labels
+        else:
+            for match in self._pattern.finditer(text):
+                hits |= self._labels[match.group(1)]
+        return frozenset(hits)
 
 
 class CulturalAgentBase(BaseAgent):
     """文化智能体基础类"""
 
-    def __init__(self, agent_id: str, agent_type: AgentType, config: Dict[str, Any]):
+    # 文化名称和文化背景，子类必须在类级别声明
+    CULTURAL_NAME: str = ""
+    CULTURAL_CONTEXT: str = ""
+
+    # 文化特征常量，子类在类级别声明后所有实例共享同一份只读数据；未声明时使用配置中的值
+    CULTURAL_VALUES: Sequence[str] = ()
+    SOCIAL_NORMS: Mapping[str, str] = MappingProxyType({})
+    COMMUNICATION_STYLE: Mapping[str, str] = MappingProxyType({})
+    DECISION_FACTORS: Sequence[str] = ()
+
+    # 置信度评估使用的文化价值观关键词，由子类声明
+    VALUE_PATTERN: Optional["re.Pattern[str]"] = None
+
+    # 所有文化智能体共享的回应缓存，智能体被卸载后重新加载时仍可命中
+    response_cache = ResponseCache()
+
+    # 自定义消息共享的静态前缀，只包含文化身份和文化背景，只需tokenize一次
+    SYSTEM_PREFIX_TEMPLATE = """
+作为{cultural_background}文化的代表：
+
+文化背景: {cultural_context}
+
+"""
+
+    def __init__(self, agent_id: str, agent_type: AgentType, config: Mapping[str, Any]):
+        # 与抽象方法一样在实例化时检查，未声明文化名称或文化背景的子类不能实例化
+        if not (self.CULTURAL_NAME and self.CULTURAL_CONTEXT):
+            raise TypeError(f"{type(self).__name__} 必须声明 CULTURAL_NAME 和 CULTURAL_CONTEXT")
+
         super().__init__(agent_id, agent_type, config)
 
         # 文化特征配置
-        self.cultural_values = config.get("cultural_values", [])
-        self.social_norms = config.get("social_norms", {})
-        self.communication_style = config.get("communication_style", {})
-        self.decision_factors = config.get("decision_factors", [])
+        self.cultural_values = self.CULTURAL_VALUES or config.get("cultural_values", [])
+        self.social_norms = self.SOCIAL_NORMS or config.get("social_norms", {})
+        self.communication_style = self.COMMUNICATION_STYLE or config.get("communication_style", {})
+        self.decision_factors = self.DECISION_FACTORS or config.get("decision_factors", [])
+
+        # 价值观评估使用的小写形式，构造时计算一次
+        self._values_lower_set = frozenset(v.lower() for v in self.cultural_values)
+        self._norms_lower = tuple(norm.lower() for norm in self.social_norms.values())
 
         # Prompt模板
         self.prompt_templates = config.get("prompt_templates", {})
 
+        # 只有确定性生成（temperature=0）的结果可以复用
+        self.use_response_cache = self.config.get("response_cache", True) and self.temperature == 0
+
+        # 按阶段确定使用的模板，并预先代入不变的文化字段；第一个场景字段之前的文本（包含文化背景）
+        # 作为该阶段的静态前缀，其余部分构建prompt时再填入场景相关的字段，两者拼接后与完整模板的结果相同
+        self._stage_prefixes: Dict[str, str] = {}
+        self._compiled_templates: Dict[str, str] = {}
+        for stage, default in _DEFAULT_PROMPT_TEMPLATES.items():
+            template = partial_format(
+                self.prompt_templates.get(stage) or default,
+                cultural_background=self._get_cultural_name(),
+                cultural_context=self._get_cultural_context()
+            )
+            self._stage_prefixes[stage], self._compiled_templates[stage] = split_static_prefix(template)
+
+        # 文化名称和文化背景为类常量，构造时拼接一次
+        self._system_prefix = self.SYSTEM_PREFIX_TEMPLATE.format(
+            cultural_background=self._get_cultural_name(),
+            cultural_context=self._get_cultural_context()
+        )
+
+    async def generate_response(self, prompt: str, context: Dict[str, Any]) -> str:
+        """生成回应，相同的确定性请求直接复用缓存结果"""
+        if not self.use_response_cache:
+            return await super().generate_response(prompt, context)
+
+        key = ResponseCache.make_key(
+            self.agent_type.value,
+            self.model_id or "",
+            context.get("stage", "initial_decision"),
+            prompt,
+            repr(sorted(context.items()))
+        )
+        return await self.response_cache.get_or_create(key, partial(super().generate_response, prompt, context))
+
+    def _get_system_prefix(self) -> str:
+        """获取文化身份和背景组成的静态前缀"""
+        return self._system_prefix
+
+    def _split_prompt(self, prompt: str, context: Dict[str, Any]) -> Tuple[str, str]:
+        """按阶段拆分为静态前缀和动态部分"""
+        stage = context.get("stage", "initial_decision")
+        prefix = self._stage_prefixes.get(stage, self._system_prefix)
+        return prefix, self._build_prompt(prompt, context)
+
+    def _get_static_prefixes(self) -> Iterable[str]:
+        """获取文化前缀及各阶段前缀"""
+        return [self._system_prefix, *self._stage_prefixes.values()]
+
     def _build_prompt(self, prompt: str, context: Dict[str, Any]) -> str:
         """构建包含文化背景的prompt"""
         # 获取场景信息
@@ -44,24 +334,9 @@ class CulturalAgentBase(BaseAgent):
 
     def _build_initial_decision_prompt(self, country: str, story: str, rule_of_thumb: str) -> str:
         """构建初始决策prompt"""
-        cultural_context = self._get_cultural_context()
-
-        template = self.prompt_templates.get("initial_decision", """
-作为{cultural_background}文化的代表，请评估以下行为在{country}是否社会可接受。
-
-文化背景: {cultural_context}
-
-规则参考: {rule_of_thumb}
-场景描述: {story}
-
-请基于你的文化价值观和对{country}文化的理解，回答这个行为是否可接受。
-回答格式：Yes/No/Neither，然后用不超过3句话解释你的理由。
-
-回答：""")
+        template = self._compiled_templates["initial_decision"]
 
         return template.format(
-            cultural_background=self._get_cultural_name(),
-            cultural_context=cultural_context,
             country=country,
             rule_of_thumb=rule_of_thumb,
             story=story
@@ -75,23 +350,9 @@ class CulturalAgentBase(BaseAgent):
         your_response = context.get("your_response", "")
         other_response = context.get("other_response", "")
 
-        template = self.prompt_templates.get("feedback", """
-作为{cultural_background}文化的代表，你正在与其他文化背景的讨论者讨论以下场景在{country}的社会可接受性。
-
-文化背景: {cultural_context}
-规则参考: {rule_of_thumb}
-场景描述: {story}
-
-你的观点: {your_response}
-对方观点: {other_response}
-
-请基于你的文化价值观，对对方的观点提供反馈。用不超过3句话回应。
-
-反馈：""")
+        template = self._compiled_templates["feedback"]
 
         return template.format(
-            cultural_background=self._get_cultural_name(),
-            cultural_context=self._get_cultural_context(),
             country=country,
             rule_of_thumb=rule_of_thumb,
             story=story,
@@ -109,27 +370,9 @@ class CulturalAgentBase(BaseAgent):
         your_feedback = context.get("your_feedback", "")
         other_feedback = context.get("other_feedback", "")
 
-        template = self.prompt_templates.get("final_decision", """
-作为{cultural_background}文化的代表，基于以下完整讨论，请做出最终决策。
-
-文化背景: {cultural_context}
-规则参考: {rule_of_thumb}
-场景描述: {story}
-
-讨论过程：
-你的初始观点: {your_response}
-对方初始观点: {other_response}
-你的反馈: {your_feedback}
-对方反馈: {other_feedback}
-
-请综合考虑讨论内容和你的文化价值观，做出最终判断。
-只需回答：Yes、No 或 Neither
-
-最终答案：""")
+        template = self._compiled_templates["final_decision"]
 
         return template.format(
-            cultural_background=self._get_cultural_name(),
-            cultural_context=self._get_cultural_context(),
             country=country,
             rule_of_thumb=rule_of_thumb,
             story=story,
@@ -140,25 +383,16 @@ class CulturalAgentBase(BaseAgent):
         )
 
     def _build_custom_prompt(self, prompt: str, context: Dict[str, Any]) -> str:
-        """构建自定义prompt"""
-        cultural_context = self._get_cultural_context()
-        return f"""
-作为{self._get_cultural_name()}文化的代表：
-
-文化背景: {cultural_context}
-
-{prompt}
-"""
+        """构建自定义prompt，文化身份和背景位于静态前缀中"""
+        return f"{prompt}\n"
 
     def _get_cultural_name(self) -> str:
         """获取文化名称"""
-        # 子类必须重写此方法
-        raise NotImplementedError("子类必须实现 _get_cultural_name 方法")
+        return self.CULTURAL_NAME
 
     def _get_cultural_context(self) -> str:
         """获取文化背景描述"""
-        # 子类必须重写此方法
-        raise NotImplementedError("子类必须实现 _get_cultural_context 方法")
+        return self.CULTURAL_CONTEXT
 
     def parse_response(self, response: str, stage: str = "initial_decision") -> Dict[str, Any]:
         """解析智能体响应"""
@@ -169,54 +403,44 @@ class CulturalAgentBase(BaseAgent):
 
     def _parse_final_answer(self, response: str) -> Dict[str, Any]:
         """解析最终答案（只有Yes/No/Neither）"""
+        # 置信度使用原始文本计算，其归一化结果在process_message中已缓存
+        confidence = self._calculate_confidence(response.strip())
         response = response.strip().lower()
 
-        # 查找答案
-        if "yes" in response:
-            answer = "yes"
-        elif "no" in response:
-            answer = "no"
-        elif "neither" in response:
-            answer = "neither"
-        else:
-            answer = "neither"  # 默认值
+        # 查找答案，未找到时默认为neither
+        answer = find_answer(response) or "neither"
 
         return {
             "answer": answer,
             "raw_response": response,
-            "confidence": self._calculate_confidence(response)
+            "confidence": confidence
         }
 
     def _parse_detailed_response(self, response: str) -> Dict[str, Any]:
         """解析详细响应（包含解释）"""
         lines = response.strip().split('\n')
         answer_line = ""
-        explanation = ""
-
-        # 查找答案行
-        for line in lines:
-            line = line.strip()
-            if any(keyword in line.lower() for keyword in ["yes", "no", "neither"]):
+        answer_idx = -1
+        answer = "neither"
+
+        # 查找答案行：优先取带标签的行，否则取第一行出现答案的行
+        labelled = [idx for idx, line in enumerate(lines) if _LABELLED_ANSWER_PATTERN.search(line)]
+        candidates = labelled or range(len(lines))
+        for idx in candidates:
+            line = lines[idx].strip()
+            found = find_answer(line)
+            if found:
+                answer_idx = idx
                 answer_line = line
+                answer = found
                 break
 
-        # 提取其余部分作为解释
+        # 提取其余行作为解释，只去掉答案行本身
         if answer_line:
-            explanation = response.replace(answer_line, "").strip()
+            explanation = "\n".join(lines[:answer_idx] + lines[answer_idx + 1:]).strip()
         else:
             explanation = response.strip()
 
-        # 解析答案
-        answer_line_lower = answer_line.lower()
-        if "yes" in answer_line_lower:
-            answer = "yes"
-        elif "no" in answer_line_lower:
-            answer = "no"
-        elif "neither" in answer_line_lower:
-            answer = "neither"
-        else:
-            answer = "neither"
-
         return {
             "answer": answer,
             "explanation": explanation,
@@ -224,26 +448,20 @@ class CulturalAgentBase(BaseAgent):
             "confidence": self._calculate_confidence(response)
         }
 
+    def _calculate_confidence(self, response: str) -> float:
+        """计算置信度，回答中包含本文化价值观关键词时提高置信度"""
+        base_confidence = super()._calculate_confidence(response)
+        if self.VALUE_PATTERN is None:
+            return base_confidence
+
+        keyword_count = count_keywords(self.VALUE_PATTERN, normalize_text(response))
+        confidence_boost = min(0.2, keyword_count * 0.05)
+        return min(0.95, base_confidence + confidence_boost)
+
     def get_cultural_similarity(self, other_agent_type: AgentType) -> float:
         """计算与其他文化智能体的相似度"""
         # 简单的相似度计算，子类可以重写
-        similarity_matrix = {
-            (AgentType.CULTURAL_CHRISTIAN, AgentType.CULTURAL_BUDDHIST): 0.3,
-            (AgentType.CULTURAL_CHRISTIAN, AgentType.CULTURAL_HINDU): 0.2,
-            (AgentType.CULTURAL_CHRISTIAN, AgentType.CULTURAL_ISLAMIC): 0.4,
-            (AgentType.CULTURAL_CHRISTIAN, AgentType.CULTURAL_TRADITIONAL): 0.1,
-            (AgentType.CULTURAL_ISLAMIC, AgentType.CULTURAL_HINDU): 0.3,
-            (AgentType.CULTURAL_ISLAMIC, AgentType.CULTURAL_BUDDHIST): 0.2,
-            (AgentType.CULTURAL_ISLAMIC, AgentType.CULTURAL_TRADITIONAL): 0.2,
-            (AgentType.CULTURAL_BUDDHIST, AgentType.CULTURAL_HINDU): 0.6,
-            (AgentType.CULTURAL_BUDDHIST, AgentType.CULTURAL_TRADITIONAL): 0.4,
-            (AgentType.CULTURAL_HINDU, AgentType.CULTURAL_TRADITIONAL): 0.3,
-        }
-
-        key1 = (self.agent_type, other_agent_type)
-        key2 = (other_agent_type, self.agent_type)
-
-        return similarity_matrix.get(key1, similarity_matrix.get(key2, 0.1))
+        return _CULTURAL_SIMILARITY.get((self.agent_type, other_agent_type), _DEFAULT_SIMILARITY)
 
     async def _handle_custom_message(self, message: AgentMessage) -> str:
         """处理文化智能体特定的消息类型"""
@@ -260,7 +478,7 @@ class CulturalAgentBase(BaseAgent):
         question = message.content.get("question", "")
 
         prompt = f"""
-基于{self._get_cultural_name()}文化的价值观和社会规范，请回答以下问题：
+基于{self.CULTURAL_NAME}文化的价值观和社会规范，请回答以下问题：
 
 场景：{scenario}
 问题：{question}
@@ -277,13 +495,7 @@ class CulturalAgentBase(BaseAgent):
 
         assessments = []
         for value in values:
-            if value.lower() in [v.lower() for v in self.cultural_values]:
-                importance = "高"
-            elif any(value.lower() in norm.lower() for norm in self.social_norms.values()):
-                importance = "中"
-            else:
-                importance = "低"
-
+            importance = _value_importance(value.lower(), self._values_lower_set, self._norms_lower)
             assessments.append(f"{value}: {importance}重要性")
 
-        return f"从{self._get_cultural_name()}文化角度的价值观评估：\n" + "\n".join(assessments)
\ No newline at end of file
+        return f"从{self.CULTURAL_NAME}文化角度的价值观评估：\n" + "\n".join(assessments)
\ No newline at end of file
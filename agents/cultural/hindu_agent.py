@@ -3,57 +3,17 @@
 代表南亚等级制度文化，强调家庭关系、社会地位和精神修养
 """
 
-from typing import Dict, Any
-from ..base.agent_interface import AgentType
-from .cultural_agent_base import CulturalAgentBase
+from types import MappingProxyType
+from typing import Dict, Any, FrozenSet
+from .cultural_agent_base import CulturalAgentBase, KeywordScanner, normalize_text, compile_keywords
 
 
 class HinduCulturalAgent(CulturalAgentBase):
     """印度教文化智能体"""
 
-    def __init__(self, agent_id: str, config: Dict[str, Any]):
-        super().__init__(agent_id, AgentType.CULTURAL_HINDU, config)
-
-        # 印度教文化价值观
-        self.cultural_values = [
-            "达摩（正义）", "家庭责任", "精神修养", "业力", "轮回",
-            "尊敬长辈", "等级制度", "传统仪式", "纯洁性", "奉献"
-        ]
-
-        # 社会规范
-        self.social_norms = {
-            "种姓制度": "传统等级制度，不同群体有不同地位",
-            "家庭角色": "强调大家庭制度，多代同堂",
-            "宗教仪式": "重要的宗教节日和仪式",
-            "穿着传统": "传统服饰在正式场合很重要，如纱丽",
-            "饮食规范": "素食主义较为普遍，牛被视为神圣",
-            "婚姻观念": "家庭安排的婚姻，重视门当户对"
-        }
-
-        # 沟通风格
-        self.communication_style = {
-            "直接性": "低",
-            "正式程度": "高",
-            "情感表达": "丰富但控制",
-            "冲突处理": "通过长辈调解，重视面子"
-        }
-
-        # 决策考虑因素
-        self.decision_factors = [
-            "家庭利益",
-            "社会地位",
-            "宗教义务",
-            "传统习俗",
-            "业力后果"
-        ]
-
-    def _get_cultural_name(self) -> str:
-        """获取文化名称"""
-        return "印度教"
-
-    def _get_cultural_context(self) -> str:
-        """获取文化背景描述"""
-        return """印度教文化强调等级制度、家庭责任和精神修养。主要特征包括：
+    # 文化名称和文化背景
+    CULTURAL_NAME = "印度教"
+    CULTURAL_CONTEXT = """印度教文化强调等级制度、家庭责任和精神修养。主要特征包括：
 - 严格的社会等级制度（种姓）
 - 大家庭制度和多代同堂
 - 重视传统和宗教仪式
@@ -65,108 +25,135 @@ class HinduCulturalAgent(CulturalAgentBase):
 - 重视社会地位和声誉
 - 通过仪式和传统维护社会秩序"""
 
-    def _analyze_scenario_from_cultural_perspective(self, scenario: str, country: str) -> Dict[str, Any]:
+    # 印度教文化价值观
+    CULTURAL_VALUES = (
+        "达摩（正义）", "家庭责任", "精神修养", "业力", "轮回",
+        "尊敬长辈", "等级制度", "传统仪式", "纯洁性", "奉献"
+    )
+
+    # 社会规范
+    SOCIAL_NORMS = MappingProxyType({
+        "种姓制度": "传统等级制度，不同群体有不同地位",
+        "家庭角色": "强调大家庭制度，多代同堂",
+        "宗教仪式": "重要的宗教节日和仪式",
+        "穿着传统": "传统服饰在正式场合很重要，如纱丽",
+        "饮食规范": "素食主义较为普遍，牛被视为神圣",
+        "婚姻观念": "家庭安排的婚姻，重视门当户对"
+    })
+
+    # 沟通风格
+    COMMUNICATION_STYLE = MappingProxyType({
+        "直接性": "低",
+        "正式程度": "高",
+        "情感表达": "丰富但控制",
+        "冲突处理": "通过长辈调解，重视面子"
+    })
+
+    # 决策考虑因素
+    DECISION_FACTORS = (
+        "家庭利益",
+        "社会地位",
+        "宗教义务",
+        "传统习俗",
+        "业力后果"
+    )
+
+    # 场景评估关键词，按类别汇总后一次扫描得出命中的全部类别
+    SCENARIO_SCANNER = KeywordScanner({
+        "righteous": ("正义", "诚实", "公正", "道德", "正确"),
+        "unrighteous": ("不义", "欺骗", "不公", "邪恶", "错误"),
+        "family_duty": ("家庭", "父母", "长辈", "责任", "照顾", "孝顺"),
+        "family_neglect": ("忽视家庭", "不孝", "背叛", "抛弃"),
+        "hierarchy_respect": ("尊敬", "地位", "等级", "权威", "长辈"),
+        "hierarchy_challenge": ("挑战", "违抗", "不敬", "平等主义"),
+        "spiritual_positive": ("冥想", "祈祷", "修行", "精神", "灵性"),
+        "spiritual_negative": ("物质主义", "贪婪", "世俗", "堕落"),
+        "traditional": ("传统", "习俗", "仪式", "古老", "祖先"),
+        "modern": ("现代", "西方", "新潮", "革新", "改变"),
+        "modern_conflict": ("冲突", "违背", "抛弃")
+    })
+
+    # 置信度评估使用的印度教价值观关键词
+    VALUE_PATTERN = compile_keywords("达摩", "家庭", "传统", "等级", "精神", "业力", "仪式")
+
+    # 文化咨询回应模板，只有分析结果部分需要填充
+    CONSULTATION_TEMPLATE = """从印度教文化（南亚等级制度文化）的角度分析：
+
+达摩合规性：{dharma_compliance}
+家庭责任：{family_duty}
+社会等级：{social_hierarchy}
+精神修养：{spiritual_aspect}
+传统价值：{traditional_values}
+
+基于印度教文化的核心价值观（达摩、家庭责任、社会等级、精神修养、传统仪式），我的建议是：
+基于上述分析，这个行为应该符合达摩和传统智慧的指导。"""
+
+    def _analyze_scenario_from_cultural_perspective(self, scenario: str) -> Dict[str, Any]:
         """从印度教文化角度分析场景"""
+        hits = self.SCENARIO_SCANNER.scan(normalize_text(scenario))
         analysis = {
-            "dharma_compliance": self._assess_dharma_compliance(scenario),
-            "family_duty": self._assess_family_duty(scenario),
-            "social_hierarchy": self._assess_social_hierarchy(scenario),
-            "spiritual_aspect": self._assess_spiritual_aspect(scenario),
-            "traditional_values": self._assess_traditional_values(scenario)
+            "dharma_compliance": self._assess_dharma_compliance(hits),
+            "family_duty": self._assess_family_duty(hits),
+            "social_hierarchy": self._assess_social_hierarchy(hits),
+            "spiritual_aspect": self._assess_spiritual_aspect(hits),
+            "traditional_values": self._assess_traditional_values(hits)
         }
 
         return analysis
 
-    def _assess_dharma_compliance(self, scenario: str) -> str:
+    def _assess_dharma_compliance(self, hits: FrozenSet[str]) -> str:
         """评估达摩（正义）合规性"""
-        righteous_keywords = ["正义", "诚实", "公正", "道德", "正确"]
-        unrighteous_keywords = ["不义", "欺骗", "不公", "邪恶", "错误"]
-
-        if any(keyword in scenario.lower() for keyword in unrighteous_keywords):
+        if "unrighteous" in hits:
             return "违背达摩（正义）"
-        elif any(keyword in scenario.lower() for keyword in righteous_keywords):
+        elif "righteous" in hits:
             return "符合达摩（正义）"
         else:
             return "达摩合规性中性"
 
-    def _assess_family_duty(self, scenario: str) -> str:
+    def _assess_family_duty(self, hits: FrozenSet[str]) -> str:
         """评估家庭责任"""
-        family_duty_keywords = ["家庭", "父母", "长辈", "责任", "照顾", "孝顺"]
-        family_neglect_keywords = ["忽视家庭", "不孝", "背叛", "抛弃"]
-
-        if any(keyword in scenario.lower() for keyword in family_neglect_keywords):
+        if "family_neglect" in hits:
             return "忽视家庭责任"
-        elif any(keyword in scenario.lower() for keyword in family_duty_keywords):
+        elif "family_duty" in hits:
             return "履行家庭责任"
         else:
             return "家庭责任影响中性"
 
-    def _assess_social_hierarchy(self, scenario: str) -> str:
+    def _assess_social_hierarchy(self, hits: FrozenSet[str]) -> str:
         """评估社会等级制度"""
-        hierarchy_respect = ["尊敬", "地位", "等级", "权威", "长辈"]
-        hierarchy_challenge = ["挑战", "违抗", "不敬", "平等主义"]
-
-        if any(keyword in scenario.lower() for keyword in hierarchy_challenge):
+        if "hierarchy_challenge" in hits:
             return "可能挑战社会等级"
-        elif any(keyword in scenario.lower() for keyword in hierarchy_respect):
+        elif "hierarchy_respect" in hits:
             return "尊重社会等级"
         else:
             return "对社会等级影响中性"
 
-    def _assess_spiritual_aspect(self, scenario: str) -> str:
+    def _assess_spiritual_aspect(self, hits: FrozenSet[str]) -> str:
         """评估精神修养方面"""
-        spiritual_positive = ["冥想", "祈祷", "修行", "精神", "灵性"]
-        spiritual_negative = ["物质主义", "贪婪", "世俗", "堕落"]
-
-        if any(keyword in scenario.lower() for keyword in spiritual_negative):
+        if "spiritual_negative" in hits:
             return "缺乏精神修养"
-        elif any(keyword in scenario.lower() for keyword in spiritual_positive):
+        elif "spiritual_positive" in hits:
             return "体现精神修养"
         else:
             return "精神修养影响中性"
 
-    def _assess_traditional_values(self, scenario: str) -> str:
+    def _assess_traditional_values(self, hits: FrozenSet[str]) -> str:
         """评估传统价值观"""
-        traditional_keywords = ["传统", "习俗", "仪式", "古老", "祖先"]
-        modern_keywords = ["现代", "西方", "新潮", "革新", "改变"]
-
-        if any(keyword in scenario.lower() for keyword in modern_keywords):
-            if any(keyword in scenario.lower() for keyword in ["冲突", "违背", "抛弃"]):
+        if "modern" in hits:
+            if "modern_conflict" in hits:
                 return "可能冲击传统价值"
             else:
                 return "现代与传统的平衡"
-        elif any(keyword in scenario.lower() for keyword in traditional_keywords):
+        elif "traditional" in hits:
             return "维护传统价值"
         else:
             return "传统价值影响中性"
 
-    def _calculate_confidence(self, response: str) -> float:
-        """计算印度教文化智能体的置信度"""
-        base_confidence = super()._calculate_confidence(response)
-
-        # 如果回答中包含印度教价值观关键词，提高置信度
-        value_keywords = ["达摩", "家庭", "传统", "等级", "精神", "业力", "仪式"]
-        keyword_count = sum(1 for keyword in value_keywords if keyword in response.lower())
-
-        confidence_boost = min(0.2, keyword_count * 0.05)
-        return min(0.95, base_confidence + confidence_boost)
-
     async def _handle_cultural_consultation(self, message) -> str:
         """处理印度教文化咨询"""
         scenario = message.content.get("scenario", "")
         question = message.content.get("question", "")
 
-        analysis = self._analyze_scenario_from_cultural_perspective(scenario, "")
-
-        response = f"""从印度教文化（南亚等级制度文化）的角度分析：
-
-达摩合规性：{analysis['dharma_compliance']}
-家庭责任：{analysis['family_duty']}
-社会等级：{analysis['social_hierarchy']}
-精神修养：{analysis['spiritual_aspect']}
-传统价值：{analysis['traditional_values']}
-
-基于印度教文化的核心价值观（达摩、家庭责任、社会等级、精神修养、传统仪式），我的建议是：
-基于上述分析，这个行为应该符合达摩和传统智慧的指导。"""
+        analysis = self._analyze_scenario_from_cultural_perspective(scenario)
 
-        return response
\ No newline at end of file
+        return self.CONSULTATION_TEMPLATE.format_map(analysis)
\ No newline at end of file
@@ -4,6 +4,7 @@
 """
 
 import asyncio
+import itertools
 import logging
 import time
 from typing import Dict, Any, List, Optional
@@ -20,6 +21,14 @@ from .cultural.traditional_agent import TraditionalCulturalAgent
 from config.agent_config import AgentConfigManager
 
 
+# 参与辩论的文化智能体类型
+CULTURAL_AGENT_TYPES = [
+    AgentType.CULTURAL_CHRISTIAN, AgentType.CULTURAL_ISLAMIC,
+    AgentType.CULTURAL_BUDDHIST, AgentType.CULTURAL_HINDU,
+    AgentType.CULTURAL_TRADITIONAL
+]
+
+
 class MultiAgentSystem:
     """多智能体系统管理器"""
 
@@ -30,10 +39,14 @@ class MultiAgentSystem:
         self.config_manager = AgentConfigManager(config_dir)
         self.agent_pool = None
         self.message_bus = None
+        self.cleanup_task: Optional[asyncio.Task] = None
 
         # 系统状态
         self.is_running = False
         self.conversation_contexts: Dict[str, Dict[str, Any]] = {}
+        self.max_conversation_contexts = 100
+        self.debate_semaphore: Optional[asyncio.Semaphore] = None
+        self.debate_counter = itertools.count()
 
         # 注册智能体类型
         self.agent_classes = {
@@ -53,6 +66,10 @@ class MultiAgentSystem:
             pool_config = self.config_manager.get_global_config()
             self.agent_pool = AgentPool(pool_config)
 
+            # 限制同时进行的辩论数量，并只保留最近的对话上下文
+            self.debate_semaphore = asyncio.Semaphore(pool_config.get("max_concurrent_debates", 4))
+            self.max_conversation_contexts = pool_config.get("max_conversation_contexts", 100)
+
             # 注册所有智能体类型
             for agent_type, agent_class in self.agent_classes.items():
                 agent_config = self.config_manager.get_agent_config(agent_type)
@@ -61,13 +78,17 @@ class MultiAgentSystem:
                     config_dict = self._convert_config_to_dict(agent_config)
                     self.agent_pool.register_agent_class(agent_type, agent_class, config_dict)
 
+            # 辩论的每个阶段都需要全部文化智能体，在max_active_agents允许的范围内预先加载并常驻，
+            # 避免阶段之间反复驱逐和重新加载；max_active_agents不小于智能体类型数时全部常驻
+            await self.agent_pool.preload(list(self.agent_pool.agent_classes))
+
             # 初始化消息总线
             bus_config = pool_config.get("message_bus", {})
             self.message_bus = MessageBus(bus_config)
             await self.message_bus.start()
 
             # 启动定期清理任务
-            asyncio.create_task(self.agent_pool.periodic_cleanup())
+            self.cleanup_task = asyncio.create_task(self.agent_pool.periodic_cleanup())
 
             self.is_running = True
             self.logger.info("多智能体系统初始化完成")
@@ -84,6 +105,15 @@ class MultiAgentSystem:
 
             self.is_running = False
 
+            # 停止定期清理任务
+            if self.cleanup_task:
+                self.cleanup_task.cancel()
+                try:
+                    await self.cleanup_task
+                except asyncio.CancelledError:
+                    pass
+                self.cleanup_task = None
+
             # 停止消息总线
             if self.message_bus:
                 await self.message_bus.stop()
@@ -107,6 +137,10 @@ class MultiAgentSystem:
             "max_new_tokens": agent_config.model_config.max_new_tokens,
             "temperature": agent_config.model_config.temperature,
             "max_input_length": agent_config.model_config.max_input_length,
+            "quantization": agent_config.model_config.quantization,
+            "attn_impl": agent_config.model_config.attn_impl,
+            "compile": agent_config.model_config.compile,
+            "api_base": agent_config.model_config.api_base,
             "hf_token": self.config_manager.get_global_config().get("hf_token", "")
         }
 
@@ -132,13 +166,20 @@ class MultiAgentSystem:
         if not self.is_running:
             raise RuntimeError("多智能体系统未初始化")
 
-        conversation_id = f"debate_{int(time.time())}"
-        self.conversation_contexts[conversation_id] = {
+        # 限制同时进行的辩论数量，超出时排队等待
+        async with self.debate_semaphore:
+            return await self._run_cultural_debate(scenario)
+
+    async def _run_cultural_debate(self, scenario: Dict[str, Any]) -> Dict[str, Any]:
+        """依次执行辩论的三个阶段"""
+        # 同一秒内启动的多个辩论用进程内计数器区分
+        conversation_id = f"debate_{int(time.time())}_{next(self.debate_counter)}"
+        context = self.conversation_contexts[conversation_id] = {
             "scenario": scenario,
             "stage": "initial_decision",
             "participants": [],
             "responses": {},
-            "start_time": time.time()
+            "start_time": time.monotonic()
         }
 
         try:
@@ -148,7 +189,6 @@ class MultiAgentSystem:
             initial_responses = await self._conduct_initial_decisions(conversation_id, scenario)
 
             # 更新对话上下文
-            context = self.conversation_contexts[conversation_id]
             context["responses"]["initial"] = initial_responses
             context["stage"] = "feedback"
 
@@ -165,7 +205,7 @@ class MultiAgentSystem:
             # 更新对话上下文
             context["responses"]["final"] = final_responses
             context["stage"] = "completed"
-            context["end_time"] = time.time()
+            context["end_time"] = time.monotonic()
 
             self.logger.info(f"文化对齐辩论完成: {conversation_id}")
 
@@ -180,28 +220,38 @@ class MultiAgentSystem:
 
         except Exception as e:
             self.logger.error(f"文化对齐辩论失败: {str(e)}")
+            context["stage"] = "failed"
             raise
 
+        finally:
+            self._trim_conversation_contexts()
+
+    def _trim_conversation_contexts(self):
+        """对话上下文超过上限时，从最早的开始移除已结束的对话"""
+        excess = len(self.conversation_contexts) - self.max_conversation_contexts
+        if excess <= 0:
+            return
+
+        finished = [conversation_id for conversation_id, context in self.conversation_contexts.items()
+                    if context["stage"] in ("completed", "failed")]
+        for conversation_id in finished[:excess]:
+            del self.conversation_contexts[conversation_id]
+
     async def _conduct_initial_decisions(self, conversation_id: str, scenario: Dict[str, Any]) -> Dict[str, Any]:
         """进行初始决策阶段"""
         self.logger.info("开始初始决策阶段")
 
         # 获取所有文化智能体
-        cultural_agents = []
-        for agent_type in [AgentType.CULTURAL_CHRISTIAN, AgentType.CULTURAL_ISLAMIC,
-                          AgentType.CULTURAL_BUDDHIST, AgentType.CULTURAL_HINDU,
-                          AgentType.CULTURAL_TRADITIONAL]:
-            agent = await self.agent_pool.get_agent(agent_type)
-            if agent:
-                cultural_agents.append(agent)
-
-        # 并行生成初始决策
+        cultural_agents = await self._get_agents(CULTURAL_AGENT_TYPES)
+
+        # 并行生成初始决策，所有智能体的上下文相同，只构建一次并共享
+        stage_context = self._stage_context("initial_decision", scenario)
         tasks = []
         for agent in cultural_agents:
-            task = self._get_agent_initial_decision(agent, scenario, conversation_id)
+            task = self._get_agent_initial_decision(agent, stage_context, conversation_id)
             tasks.append(task)
 
-        responses = await asyncio.gather(*tasks, return_exceptions=True)
+        responses = await self._gather(tasks, return_exceptions=True)
 
         # 整理响应结果
         initial_responses = {}
@@ -213,7 +263,41 @@ class MultiAgentSystem:
 
         return initial_responses
 
-    async def _get_agent_initial_decision(self, agent, scenario: Dict[str, Any], conversation_id: str) -> Dict[str, Any]:
+    async def _get_agents(self, agent_types: List[AgentType]) -> List[Any]:
+        """并发获取多个智能体，跳过获取失败的类型"""
+        agents = await self._gather([self.agent_pool.get_agent(t) for t in agent_types])
+        return [agent for agent in agents if agent]
+
+    @staticmethod
+    async def _gather(tasks: List, return_exceptions: bool = False) -> List[Any]:
+        """并发等待多个协程，只有一个时直接await，省去gather的调度开销"""
+        if len(tasks) == 1:
+            try:
+                return [await tasks[0]]
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return [e]
+        return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+
+    @staticmethod
+    def _other_key(keys: List[str], key: str) -> Optional[str]:
+        """选择另一个智能体作为交流对象（取第一个不是自己的智能体），没有其他智能体时返回None"""
+        if len(keys) < 2:
+            return None
+        return keys[1] if keys[0] == key else keys[0]
+
+    @staticmethod
+    def _stage_context(stage: str, scenario: Dict[str, Any]) -> Dict[str, Any]:
+        """构建同一阶段所有智能体共享的场景上下文，智能体只读取不修改"""
+        return {
+            "stage": stage,
+            "country": scenario.get("country", ""),
+            "story": scenario.get("story", ""),
+            "rule_of_thumb": scenario.get("rule_of_thumb", "")
+        }
+
+    async def _get_agent_initial_decision(self, agent, stage_context: Dict[str, Any], conversation_id: str) -> Dict[str, Any]:
         """获取单个智能体的初始决策"""
         try:
             message = AgentMessage(
@@ -222,18 +306,13 @@ class MultiAgentSystem:
                 message_type="generate_response",
                 content={
                     "prompt": "",  # 将由智能体内部构建
-                    "context": {
-                        "stage": "initial_decision",
-                        "country": scenario.get("country", ""),
-                        "story": scenario.get("story", ""),
-                        "rule_of_thumb": scenario.get("rule_of_thumb", "")
-                    }
+                    "context": stage_context
                 },
                 timestamp=time.time(),
                 conversation_id=conversation_id
             )
 
-            response = await agent.process_message(message)
+            response = await agent.submit_message(message)
             parsed_response = agent.parse_response(response.response_text, "initial_decision")
 
             return {
@@ -256,33 +335,40 @@ class MultiAgentSystem:
         scenario = context["scenario"]
 
         # 获取所有参与的智能体
-        participating_agents = []
-        for agent_type_str in initial_responses.keys():
-            agent_type = AgentType(agent_type_str)
-            agent = await self.agent_pool.get_agent(agent_type)
-            if agent:
-                participating_agents.append(agent)
-
-        # 生成反馈（每个智能体对其他智能体的回应进行反馈）
-        feedback_responses = {}
+        participating_agents = await self._get_agents([AgentType(t) for t in initial_responses])
+
+        # 并行生成反馈（每个智能体对其他智能体的回应进行反馈）
+        stage_context = self._stage_context("feedback", scenario)
+        response_keys = list(initial_responses)
+        agent_type_strs = []
+        tasks = []
         for agent in participating_agents:
             agent_type_str = agent.agent_type.value
             your_response = initial_responses[agent_type_str]["raw_response"]
 
             # 选择另一个智能体的回应作为反馈目标
-            other_responses = {k: v for k, v in initial_responses.items() if k != agent_type_str}
-            if other_responses:
-                other_agent_type, other_response_data = next(iter(other_responses.items()))
-                other_response = other_response_data["raw_response"]
+            other_agent_type = self._other_key(response_keys, agent_type_str)
+            if other_agent_type is not None:
+                other_response = initial_responses[other_agent_type]["raw_response"]
+
+                agent_type_strs.append(agent_type_str)
+                tasks.append(self._get_agent_feedback(
+                    agent, stage_context, your_response, other_response, conversation_id
+                ))
 
-                feedback = await self._get_agent_feedback(
-                    agent, scenario, your_response, other_response, conversation_id
-                )
-                feedback_responses[agent_type_str] = feedback
+        responses = await self._gather(tasks, return_exceptions=True)
+
+        # 整理响应结果，失败的智能体不影响其他智能体
+        feedback_responses = {}
+        for agent_type_str, response in zip(agent_type_strs, responses):
+            if isinstance(response, Exception):
+                self.logger.error("智能体 %s 反馈失败: %s", agent_type_str, response)
+            else:
+                feedback_responses[agent_type_str] = response
 
         return feedback_responses
 
-    async def _get_agent_feedback(self, agent, scenario: Dict[str, Any], your_response: str,
+    async def _get_agent_feedback(self, agent, stage_context: Dict[str, Any], your_response: str,
                                  other_response: str, conversation_id: str) -> Dict[str, Any]:
         """获取智能体反馈"""
         try:
@@ -293,10 +379,7 @@ class MultiAgentSystem:
                 content={
                     "prompt": "",
                     "context": {
-                        "stage": "feedback",
-                        "country": scenario.get("country", ""),
-                        "story": scenario.get("story", ""),
-                        "rule_of_thumb": scenario.get("rule_of_thumb", ""),
+                        **stage_context,
                         "your_response": your_response,
                         "other_response": other_response
                     }
@@ -305,7 +388,7 @@ class MultiAgentSystem:
                 conversation_id=conversation_id
             )
 
-            response = await agent.process_message(message)
+            response = await agent.submit_message(message)
 
             return {
                 "raw_response": response.response_text,
@@ -327,15 +410,12 @@ class MultiAgentSystem:
         scenario = context["scenario"]
 
         # 获取所有参与的智能体
-        participating_agents = []
-        for agent_type_str in initial_responses.keys():
-            agent_type = AgentType(agent_type_str)
-            agent = await self.agent_pool.get_agent(agent_type)
-            if agent:
-                participating_agents.append(agent)
-
-        # 生成最终决策
-        final_responses = {}
+        participating_agents = await self._get_agents([AgentType(t) for t in initial_responses])
+
+        # 并行生成最终决策
+        stage_context = self._stage_context("final_decision", scenario)
+        response_keys = list(initial_responses)
+        tasks = []
         for agent in participating_agents:
             agent_type_str = agent.agent_type.value
 
@@ -344,22 +424,30 @@ class MultiAgentSystem:
             your_feedback = feedback_responses.get(agent_type_str, {}).get("raw_response", "")
 
             # 获取其他智能体的回应（简化处理，取第一个其他智能体）
-            other_responses = {k: v for k, v in initial_responses.items() if k != agent_type_str}
+            other_agent_type = self._other_key(response_keys, agent_type_str)
             other_initial = ""
             other_feedback = ""
-            if other_responses:
-                other_agent_type, other_data = next(iter(other_responses.items()))
-                other_initial = other_data["raw_response"]
+            if other_agent_type is not None:
+                other_initial = initial_responses[other_agent_type]["raw_response"]
                 other_feedback = feedback_responses.get(other_agent_type, {}).get("raw_response", "")
 
-            final_decision = await self._get_agent_final_decision(
-                agent, scenario, your_initial, other_initial, your_feedback, other_feedback, conversation_id
-            )
-            final_responses[agent_type_str] = final_decision
+            tasks.append(self._get_agent_final_decision(
+                agent, stage_context, your_initial, other_initial, your_feedback, other_feedback, conversation_id
+            ))
+
+        responses = await self._gather(tasks, return_exceptions=True)
+
+        # 整理响应结果，失败的智能体不影响其他智能体
+        final_responses = {}
+        for agent, response in zip(participating_agents, responses):
+            if isinstance(response, Exception):
+                self.logger.error("智能体 %s 最终决策失败: %s", agent.agent_id, response)
+            else:
+                final_responses[agent.agent_type.value] = response
 
         return final_responses
 
-    async def _get_agent_final_decision(self, agent, scenario: Dict[str, Any], your_response: str,
+    async def _get_agent_final_decision(self, agent, stage_context: Dict[str, Any], your_response: str,
                                        other_response: str, your_feedback: str, other_feedback: str,
                                        conversation_id: str) -> Dict[str, Any]:
         """获取智能体最终决策"""
@@ -371,10 +459,7 @@ class MultiAgentSystem:
                 content={
                     "prompt": "",
                     "context": {
-                        "stage": "final_decision",
-                        "country": scenario.get("country", ""),
-                        "story": scenario.get("story", ""),
-                        "rule_of_thumb": scenario.get("rule_of_thumb", ""),
+                        **stage_context,
                         "your_response": your_response,
                         "other_response": other_response,
                         "your_feedback": your_feedback,
@@ -385,7 +470,7 @@ class MultiAgentSystem:
                 conversation_id=conversation_id
             )
 
-            response = await agent.process_message(message)
+            response = await agent.submit_message(message)
             parsed_response = agent.parse_response(response.response_text, "final_decision")
 
             return {
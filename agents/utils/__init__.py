@@ -4,8 +4,10 @@
 
 from .agent_pool import AgentPool
 from .message_bus import MessageBus
+from .response_cache import ResponseCache
 
 __all__ = [
     'AgentPool',
-    'MessageBus'
+    'MessageBus',
+    'ResponseCache'
 ]
\ No newline at end of file
@@ -7,16 +7,24 @@ import asyncio
 import logging
 import time
 import torch
-from typing import Dict, Any, Optional, List, Type
+from typing import Dict, Any, Optional, List, Mapping, Set, Type
 from collections import OrderedDict
+from types import MappingProxyType
 from dataclasses import dataclass
 
 from ..base.agent_interface import AgentInterface, AgentType, AgentStatus
 
 
+# 每种智能体类型在槽位数组中的固定下标
+_SLOT_INDEX: Dict[AgentType, int] = {agent_type: index for index, agent_type in enumerate(AgentType)}
+
+
 @dataclass
 class AgentPoolStats:
     """智能体池统计信息"""
+    __slots__ = ("total_agents", "active_agents", "loading_agents", "memory_usage_mb",
+                 "gpu_utilization", "cache_hit_rate")
+
     total_agents: int
     active_agents: int
     loading_agents: int
@@ -36,12 +44,27 @@ class AgentPool:
         self.max_active_agents = config.get("max_active_agents", 3)
         self.idle_timeout = config.get("idle_timeout", 300.0)  # 5分钟
         self.memory_threshold = config.get("memory_threshold", 0.8)  # 80%
+        self.max_concurrent_loads = config.get("max_concurrent_loads", 1)
+
+        # GPU总显存不会变化，只查询一次
+        self.total_memory = torch.cuda.get_device_properties(0).total_memory if torch.cuda.is_available() else 0
 
         # 智能体存储
         self.active_agents: OrderedDict[str, AgentInterface] = OrderedDict()
-        self.agent_configs: Dict[AgentType, Dict[str, Any]] = {}
+        self.agent_configs: Dict[AgentType, Mapping[str, Any]] = {}
         self.agent_classes: Dict[AgentType, Type[AgentInterface]] = {}
 
+        # 按类型下标索引的已加载智能体，热路径直接按下标取用；active_agents只维护LRU顺序
+        self._slots: List[Optional[AgentInterface]] = [None] * len(_SLOT_INDEX)
+
+        # 常驻的智能体ID，不会被LRU驱逐或空闲清理卸载
+        self.pinned: Set[str] = set()
+
+        # 正在加载的智能体，并发获取同一智能体时共享一次加载
+        self._loading: Dict[str, asyncio.Future] = {}
+        # 已占用容量但尚未加入活跃池的加载数
+        self._pending_loads = 0
+
         # 统计信息
         self.total_requests = 0
         self.cache_hits = 0
@@ -50,43 +73,88 @@ class AgentPool:
 
         # 锁和信号量
         self.pool_lock = asyncio.Lock()
-        self.loading_semaphore = asyncio.Semaphore(1)  # 同时只允许一个加载操作
+        # 限制同时进行的加载数，控制模型初始化时的显存峰值；同一智能体的重复加载由_loading去重
+        self.loading_semaphore = asyncio.Semaphore(self.max_concurrent_loads)
 
     def register_agent_class(self, agent_type: AgentType, agent_class: Type[AgentInterface], config: Dict[str, Any]):
         """注册智能体类型和配置"""
         self.agent_classes[agent_type] = agent_class
-        self.agent_configs[agent_type] = config
+        # 保存为只读视图，每次加载直接共享同一份配置，无需复制
+        self.agent_configs[agent_type] = MappingProxyType(dict(config))
         self.logger.info(f"注册智能体类型: {agent_type.value}")
 
     async def get_agent(self, agent_type: AgentType) -> Optional[AgentInterface]:
         """获取智能体实例"""
+        self.total_requests += 1
+
+        # 快速路径：命中时不加锁，事件循环单线程执行，以下操作之间没有await，本身是原子的
+        agent = self._slots[_SLOT_INDEX[agent_type]]
+        if agent is not None:
+            # 常驻智能体不会被驱逐，无需更新LRU顺序
+            if agent.agent_id not in self.pinned:
+                self.active_agents.move_to_end(agent.agent_id)
+            self.cache_hits += 1
+            self.logger.debug("从缓存获取智能体: %s", agent.agent_id)
+            return agent
+
+        agent_id = f"{agent_type.value}_instance"
+
+        # 慢速路径：需要加载时才加锁，加载本身在锁外进行
         async with self.pool_lock:
-            self.total_requests += 1
-            agent_id = f"{agent_type.value}_instance"
-
-            # 检查是否已在活跃池中
-            if agent_id in self.active_agents:
-                agent = self.active_agents[agent_id]
-                # 移到最后（LRU更新）
-                self.active_agents.move_to_end(agent_id)
-                self.cache_hits += 1
-                self.logger.debug(f"从缓存获取智能体: {agent_id}")
-                return agent
+            # 同一智能体正在加载时，等待同一次加载的结果
+            loading = self._loading.get(agent_id)
+            is_loader = loading is None
+            if is_loader:
+                loading = asyncio.get_running_loop().create_future()
+                self._loading[agent_id] = loading
+
+        if not is_loader:
+            return await asyncio.shield(loading)
 
-            # 检查是否需要清理空间
-            if len(self.active_agents) >= self.max_active_agents:
+        try:
+            agent = await self._load_agent(agent_type)
+        except BaseException:
+            loading.cancel()
+            raise
+        finally:
+            del self._loading[agent_id]
+
+        loading.set_result(agent)
+        return agent
+
+    async def preload(self, agent_types: List[AgentType]) -> int:
+        """预先加载指定类型的智能体并设为常驻，返回成功加载的数量"""
+        # 常驻数量不超过max_active_agents；放不下全部类型时留出一个位置给LRU轮换其余类型
+        limit = self.max_active_agents if len(agent_types) <= self.max_active_agents else self.max_active_agents - 1
+        if limit < len(agent_types):
+            self.logger.warning(
+                "max_active_agents=%d，只预加载 %d/%d 个智能体",
+                self.max_active_agents, max(limit, 0), len(agent_types)
+            )
+            agent_types = agent_types[:max(limit, 0)]
+
+        loaded = 0
+        for agent_type in agent_types:
+            agent = await self.get_agent(agent_type)
+            if agent is not None:
+                self.pinned.add(agent.agent_id)
+                loaded += 1
+
+        self.logger.info("预加载完成，常驻智能体: %d/%d", loaded, len(agent_types))
+        return loaded
+
+    async def _load_agent(self, agent_type: AgentType) -> Optional[AgentInterface]:
+        """加载智能体"""
+        async with self.loading_semaphore:
+            # 检查是否需要清理空间（计入其他正在进行的加载）
+            if len(self.active_agents) + self._pending_loads >= self.max_active_agents:
                 await self._evict_lru_agent()
 
             # 检查内存使用情况
             if self._get_memory_usage() > self.memory_threshold:
                 await self._cleanup_memory()
 
-            # 加载新智能体
-            return await self._load_agent(agent_type)
-
-    async def _load_agent(self, agent_type: AgentType) -> Optional[AgentInterface]:
-        """加载智能体"""
-        async with self.loading_semaphore:
+            self._pending_loads += 1
             try:
                 if agent_type not in self.agent_classes:
                     self.logger.error(f"未注册的智能体类型: {agent_type.value}")
@@ -97,7 +165,7 @@ class AgentPool:
 
                 # 创建智能体实例
                 agent_class = self.agent_classes[agent_type]
-                config = self.agent_configs[agent_type].copy()
+                config = self.agent_configs[agent_type]
                 agent = agent_class(agent_id, agent_type, config)
 
                 # 初始化智能体
@@ -108,6 +176,7 @@ class AgentPool:
 
                 # 添加到活跃池
                 self.active_agents[agent_id] = agent
+                self._slots[_SLOT_INDEX[agent_type]] = agent
                 self.load_operations += 1
 
                 self.logger.info(f"智能体加载完成: {agent_id}")
@@ -117,14 +186,18 @@ class AgentPool:
                 self.logger.error(f"加载智能体失败: {str(e)}")
                 return None
 
+            finally:
+                self._pending_loads -= 1
+
     async def _evict_lru_agent(self):
         """驱逐最少使用的智能体"""
         if not self.active_agents:
             return
 
-        # 获取最少使用的智能体（OrderedDict的第一个）
-        lru_agent_id = next(iter(self.active_agents))
-        lru_agent = self.active_agents[lru_agent_id]
+        # 获取最少使用的非常驻智能体（OrderedDict中最靠前的）
+        lru_agent_id = next((agent_id for agent_id in self.active_agents if agent_id not in self.pinned), None)
+        if lru_agent_id is None:
+            return
 
         self.logger.info(f"驱逐LRU智能体: {lru_agent_id}")
         await self._unload_agent(lru_agent_id)
@@ -143,6 +216,7 @@ class AgentPool:
 
             # 从活跃池中移除
             del self.active_agents[agent_id]
+            self._slots[_SLOT_INDEX[agent.agent_type]] = None
             self.unload_operations += 1
 
             self.logger.info(f"智能体卸载完成: {agent_id}")
@@ -159,6 +233,8 @@ class AgentPool:
         current_time = time.time()
 
         for agent_id, agent in self.active_agents.items():
+            if agent_id in self.pinned:
+                continue
             if hasattr(agent, 'is_idle') and agent.is_idle(self.idle_timeout):
                 idle_agents.append(agent_id)
 
@@ -168,20 +244,18 @@ class AgentPool:
 
         # 强制垃圾回收
         if torch.cuda.is_available():
-            torch.cuda.empty_cache()
+            # empty_cache会同步设备，放到工作线程中执行，避免阻塞事件循环
+            await asyncio.get_running_loop().run_in_executor(None, torch.cuda.empty_cache)
 
         self.logger.info(f"内存清理完成，卸载了 {len(idle_agents)} 个空闲智能体")
 
     def _get_memory_usage(self) -> float:
         """获取GPU内存使用率"""
-        if not torch.cuda.is_available():
+        if not self.total_memory or not self.active_agents:
             return 0.0
 
         try:
-            allocated = torch.cuda.memory_allocated()
-            reserved = torch.cuda.memory_reserved()
-            total = torch.cuda.get_device_properties(0).total_memory
-            return allocated / total
+            return torch.cuda.memory_allocated() / self.total_memory
         except Exception:
             return 0.0
 
@@ -219,18 +293,17 @@ class AgentPool:
     def get_stats(self) -> AgentPoolStats:
         """获取池统计信息"""
         active_count = len(self.active_agents)
-        loading_count = sum(1 for agent in self.active_agents.values()
-                           if agent.get_status() == AgentStatus.LOADING)
 
         cache_hit_rate = (self.cache_hits / self.total_requests
                          if self.total_requests > 0 else 0.0)
+        memory_usage = self._get_memory_usage()
 
         return AgentPoolStats(
             total_agents=len(self.agent_classes),
             active_agents=active_count,
-            loading_agents=loading_count,
-            memory_usage_mb=self._get_memory_usage() * 1024,  # 转换为MB
-            gpu_utilization=self._get_memory_usage(),
+            loading_agents=self._pending_loads,
+            memory_usage_mb=memory_usage * 1024,  # 转换为MB
+            gpu_utilization=memory_usage,
             cache_hit_rate=cache_hit_rate
         )
 
@@ -258,6 +331,9 @@ class AgentPool:
         while True:
             try:
                 await asyncio.sleep(60)  # 每分钟执行一次
+                # 没有已加载的智能体时无需检查
+                if not self.active_agents:
+                    continue
                 await self.health_check()
 
                 # 定期统计日志
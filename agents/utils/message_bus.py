@@ -4,12 +4,13 @@
 """
 
 import asyncio
+import itertools
 import logging
 import time
 import uuid
-from typing import Dict, Any, List, Optional, Callable, Set
+from typing import Dict, Any, List, Optional, Callable, Set, Tuple
 from collections import defaultdict, deque
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 
 from ..base.agent_interface import AgentMessage, AgentType
 
@@ -32,7 +33,7 @@ class MessageStats:
     total_broadcast: int = 0
     failed_deliveries: int = 0
     average_delivery_time: float = 0.0
-    message_types: Dict[str, int] = field(default_factory=dict)
+    message_types: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
 
 
 class MessageBus:
@@ -46,27 +47,44 @@ class MessageBus:
         self.max_queue_size = config.get("max_queue_size", 1000)
         self.message_timeout = config.get("message_timeout", 30.0)
         self.retry_attempts = config.get("retry_attempts", 3)
+        self.busy_queue_size = 0.9 * self.max_queue_size  # 队列长度超过该值视为使用率过高
 
         # 消息存储
-        self.message_queues: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.max_queue_size))
+        # 队列在第一次向该智能体投递消息时创建，查询不会创建空队列
+        self.message_queues: Dict[str, deque] = {}
+        # 按发送顺序记录 (过期时间, 接收方)，所有消息超时相同，过期时间天然有序
+        self.expiry_index: deque = deque()
+        # 每个智能体的新消息通知，接收方等待通知而不是轮询队列
+        self.message_events: Dict[str, asyncio.Event] = defaultdict(asyncio.Event)
+        # 使用率超过90%的队列，在入队和出队时维护，健康检查无需扫描所有队列
+        self.busy_queues: Set[str] = set()
         self.pending_messages: Dict[str, AgentMessage] = {}
         self.message_handlers: Dict[str, Callable] = {}
 
+        # 消息ID由总线ID和递增序号组成，无需每条消息生成UUID
+        self.bus_id = uuid.uuid4().hex[:8]
+        self.message_seq = itertools.count()
+
         # 路由配置
         self.routes: List[MessageRoute] = []
         self.subscribers: Dict[str, Set[str]] = defaultdict(set)  # message_type -> agent_ids
+        # 订阅者的元组快照，订阅变化时重建，广播时直接遍历
+        self._subscriber_snapshots: Dict[str, Tuple[str, ...]] = {}
 
         # 统计信息
         self.stats = MessageStats()
         self.delivery_times: deque = deque(maxlen=100)
+        self.delivery_time_sum = 0.0  # 窗口内投递时间之和，增量维护
 
         # 异步任务
         self.running = False
         self.message_processor_task = None
+        self.expiry_event: Optional[asyncio.Event] = None  # 有新的待过期消息时唤醒后台任务
 
     async def start(self):
         """启动消息总线"""
         self.running = True
+        self.expiry_event = asyncio.Event()
         self.message_processor_task = asyncio.create_task(self._message_processor())
         self.logger.info("消息总线已启动")
 
@@ -84,8 +102,7 @@ class MessageBus:
     async def send_message(self, message: AgentMessage) -> bool:
         """发送消息"""
         try:
-            message_id = str(uuid.uuid4())
-            message.content["message_id"] = message_id
+            message.message_id = f"{self.bus_id}-{next(self.message_seq)}"
 
             # 记录发送时间
             send_time = time.time()
@@ -106,22 +123,34 @@ class MessageBus:
 
     async def _unicast_message(self, message: AgentMessage) -> bool:
         """单播消息"""
+        return self._deliver(message)
+
+    def _deliver(self, message: AgentMessage) -> bool:
+        """将消息放入接收方队列，入队不涉及任何等待，广播时直接同步调用"""
         try:
             # 检查队列是否已满
-            queue = self.message_queues[message.receiver_id]
+            queue = self.message_queues.get(message.receiver_id)
+            if queue is None:
+                queue = self.message_queues[message.receiver_id] = deque(maxlen=self.max_queue_size)
             if len(queue) >= self.max_queue_size:
                 self.logger.warning(f"智能体 {message.receiver_id} 的消息队列已满")
                 return False
 
-            # 添加到队列
+            # 添加到队列并唤醒等待的接收方
             queue.append(message)
+            if len(queue) > self.busy_queue_size:
+                self.busy_queues.add(message.receiver_id)
+            if not self.expiry_index and self.expiry_event is not None:
+                self.expiry_event.set()
+            self.expiry_index.append((message.timestamp + self.message_timeout, message.receiver_id))
+            self.message_events[message.receiver_id].set()
             self.stats.total_sent += 1
 
             # 更新消息类型统计
             msg_type = message.message_type
-            self.stats.message_types[msg_type] = self.stats.message_types.get(msg_type, 0) + 1
+            self.stats.message_types[msg_type] += 1
 
-            self.logger.debug(f"消息已发送: {message.sender_id} -> {message.receiver_id} ({msg_type})")
+            self.logger.debug("消息已发送: %s -> %s (%s)", message.sender_id, message.receiver_id, msg_type)
             return True
 
         except Exception as e:
@@ -132,7 +161,7 @@ class MessageBus:
         """广播消息"""
         try:
             # 获取订阅者列表
-            subscribers = self.subscribers.get(message.message_type, set())
+            subscribers = self._subscriber_snapshots.get(message.message_type, ())
             if not subscribers:
                 self.logger.warning(f"消息类型 {message.message_type} 没有订阅者")
                 return True
@@ -140,20 +169,15 @@ class MessageBus:
             success_count = 0
             for agent_id in subscribers:
                 if agent_id != message.sender_id:  # 不发送给自己
-                    broadcast_msg = AgentMessage(
-                        sender_id=message.sender_id,
-                        receiver_id=agent_id,
-                        message_type=message.message_type,
-                        content=message.content.copy(),
-                        timestamp=message.timestamp,
-                        conversation_id=message.conversation_id
-                    )
-
-                    if await self._unicast_message(broadcast_msg):
+                    # replace不复制init=False的message_id，需要单独沿用原消息的ID
+                    broadcast_msg = replace(message, receiver_id=agent_id, content=message.content.copy())
+                    broadcast_msg.message_id = message.message_id
+
+                    if self._deliver(broadcast_msg):
                         success_count += 1
 
             self.stats.total_broadcast += 1
-            self.logger.debug(f"广播消息已发送给 {success_count} 个订阅者")
+            self.logger.debug("广播消息已发送给 %d 个订阅者", success_count)
             return success_count > 0
 
         except Exception as e:
@@ -164,23 +188,35 @@ class MessageBus:
         """接收消息"""
         try:
             timeout = timeout or self.message_timeout
-            queue = self.message_queues[agent_id]
-
-            # 等待消息到达
-            start_time = time.time()
-            while not queue and (time.time() - start_time) < timeout:
-                await asyncio.sleep(0.1)
+            queue = self.message_queues.get(agent_id)
+
+            # 等待消息到达，被唤醒后队列可能已被其他接收方取空，需要重新检查
+            if not queue:
+                event = self.message_events[agent_id]
+                loop = asyncio.get_running_loop()
+                deadline = loop.time() + timeout
+                while not queue:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    event.clear()
+                    try:
+                        await asyncio.wait_for(event.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    queue = self.message_queues.get(agent_id)
 
             if queue:
                 message = queue.popleft()
+                if len(queue) <= self.busy_queue_size:
+                    self.busy_queues.discard(agent_id)
                 self.stats.total_received += 1
 
                 # 计算投递时间
                 delivery_time = time.time() - message.timestamp
-                self.delivery_times.append(delivery_time)
-                self._update_average_delivery_time()
+                self._record_delivery_time(delivery_time)
 
-                self.logger.debug(f"消息已接收: {agent_id} <- {message.sender_id}")
+                self.logger.debug("消息已接收: %s <- %s", agent_id, message.sender_id)
                 return message
 
             return None
@@ -193,85 +229,80 @@ class MessageBus:
         """订阅消息类型"""
         for msg_type in message_types:
             self.subscribers[msg_type].add(agent_id)
-        self.logger.debug(f"智能体 {agent_id} 订阅了消息类型: {message_types}")
+            self._subscriber_snapshots[msg_type] = tuple(self.subscribers[msg_type])
+        self.logger.debug("智能体 %s 订阅了消息类型: %s", agent_id, message_types)
 
     def unsubscribe(self, agent_id: str, message_types: List[str] = None):
         """取消订阅"""
         if message_types is None:
             # 取消所有订阅
-            for msg_type in list(self.subscribers.keys()):
-                self.subscribers[msg_type].discard(agent_id)
-        else:
-            for msg_type in message_types:
-                self.subscribers[msg_type].discard(agent_id)
+            message_types = list(self.subscribers.keys())
+
+        for msg_type in message_types:
+            self.subscribers[msg_type].discard(agent_id)
+            self._subscriber_snapshots[msg_type] = tuple(self.subscribers[msg_type])
 
-        self.logger.debug(f"智能体 {agent_id} 取消订阅")
+        self.logger.debug("智能体 %s 取消订阅", agent_id)
 
     def add_route(self, route: MessageRoute):
         """添加消息路由"""
         self.routes.append(route)
-        self.logger.debug(f"添加路由: {route.sender_pattern} -> {route.receiver_pattern}")
+        self.logger.debug("添加路由: %s -> %s", route.sender_pattern, route.receiver_pattern)
 
     def register_handler(self, message_type: str, handler: Callable):
         """注册消息处理器"""
         self.message_handlers[message_type] = handler
-        self.logger.debug(f"注册处理器: {message_type}")
+        self.logger.debug("注册处理器: %s", message_type)
 
     async def _message_processor(self):
-        """消息处理器（后台任务）"""
+        """消息处理器（后台任务）：在最早的消息到期时清理过期消息，没有待过期的消息时不唤醒"""
         self.logger.info("消息处理器启动")
 
         while self.running:
             try:
-                # 处理路由规则
-                await self._process_routes()
+                if not self.expiry_index:
+                    self.expiry_event.clear()
+                    await self.expiry_event.wait()
+                    continue
 
-                # 处理超时消息
+                # 过期时间按发送顺序递增，新消息不会比队首更早到期，只需等待队首
+                await asyncio.sleep(max(self.expiry_index[0][0] - time.time(), 0.0))
                 await self._cleanup_expired_messages()
 
-                # 统计信息更新
-                await self._update_stats()
-
-                await asyncio.sleep(0.5)
-
             except Exception as e:
                 self.logger.error(f"消息处理器错误: {str(e)}")
                 await asyncio.sleep(1.0)
 
         self.logger.info("消息处理器停止")
 
-    async def _process_routes(self):
-        """处理路由规则"""
-        # 简单实现，可以扩展为更复杂的路由逻辑
-        pass
-
     async def _cleanup_expired_messages(self):
         """清理过期消息"""
         current_time = time.time()
         expired_count = 0
 
-        for agent_id, queue in self.message_queues.items():
-            # 移除过期消息
-            while queue:
-                message = queue[0]
-                if (current_time - message.timestamp) > self.message_timeout:
-                    queue.popleft()
-                    expired_count += 1
-                else:
-                    break
+        # 只检查有消息到期的队列，不再逐个扫描所有队列
+        expiry_index = self.expiry_index
+        while expiry_index and expiry_index[0][0] < current_time:
+            _, agent_id = expiry_index.popleft()
+            queue = self.message_queues.get(agent_id)
 
-        if expired_count > 0:
-            self.logger.debug(f"清理了 {expired_count} 条过期消息")
+            # 到期的消息可能已被接收，只移除队首仍然过期的消息
+            while queue and (current_time - queue[0].timestamp) > self.message_timeout:
+                queue.popleft()
+                expired_count += 1
+            if queue is not None and len(queue) <= self.busy_queue_size:
+                self.busy_queues.discard(agent_id)
 
-    async def _update_stats(self):
-        """更新统计信息"""
-        # 更新平均投递时间
-        self._update_average_delivery_time()
+        if expired_count > 0:
+            self.logger.debug("清理了 %d 条过期消息", expired_count)
 
-    def _update_average_delivery_time(self):
-        """更新平均投递时间"""
-        if self.delivery_times:
-            self.stats.average_delivery_time = sum(self.delivery_times) / len(self.delivery_times)
+    def _record_delivery_time(self, delivery_time: float):
+        """记录投递时间并增量更新最近100条消息的平均投递时间"""
+        if len(self.delivery_times) == self.delivery_times.maxlen:
+            self.delivery_time_sum -= self.delivery_times[0]
+        self.delivery_times.append(delivery_time)
+        self.delivery_time_sum += delivery_time
+        self.stats.average_delivery_time = self.delivery_time_sum / len(self.delivery_times)
 
     def get_stats(self) -> MessageStats:
         """获取统计信息"""
@@ -293,12 +324,14 @@ class MessageBus:
         if agent_id in self.message_queues:
             cleared_count = len(self.message_queues[agent_id])
             self.message_queues[agent_id].clear()
+            self.busy_queues.discard(agent_id)
             self.logger.info(f"清空智能体 {agent_id} 的消息队列，清理了 {cleared_count} 条消息")
 
     def clear_all_queues(self):
         """清空所有消息队列"""
         total_cleared = sum(len(queue) for queue in self.message_queues.values())
         self.message_queues.clear()
+        self.busy_queues.clear()
         self.logger.info(f"清空所有消息队列，总共清理了 {total_cleared} 条消息")
 
     async def health_check(self) -> bool:
@@ -308,11 +341,10 @@ class MessageBus:
             if not self.running or not self.message_processor_task:
                 return False
 
-            # 检查队列使用率
-            for agent_id, queue in self.message_queues.items():
-                usage_rate = len(queue) / self.max_queue_size
-                if usage_rate > 0.9:  # 队列使用率超过90%
-                    self.logger.warning(f"智能体 {agent_id} 队列使用率过高: {usage_rate:.2%}")
+            # 检查队列使用率，只需检查使用率超过90%的队列
+            for agent_id in self.busy_queues:
+                usage_rate = len(self.message_queues[agent_id]) / self.max_queue_size
+                self.logger.warning(f"智能体 {agent_id} 队列使用率过高: {usage_rate:.2%}")
 
             # 检查投递失败率
             if self.stats.total_sent > 0:
@@ -0,0 +1,87 @@
+"""
+回应缓存
+缓存确定性生成的结果，相同输入的重复请求直接返回，并发的相同请求只生成一次
+"""
+
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, Callable, Awaitable
+
+
+class ResponseCache:
+    """进程内LRU回应缓存"""
+
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max_size
+        self.logger = logging.getLogger("ResponseCache")
+
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """由各输入字段计算缓存键"""
+        return hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+    async def get_or_create(self, key: str, factory: Callable[[], Awaitable[str]]) -> str:
+        """命中时直接返回缓存结果，否则调用factory生成并缓存；生成失败时不缓存"""
+        while True:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+            # 相同的请求正在生成，等待其结果
+            pending = self._pending.get(key)
+            if pending is None:
+                break
+            try:
+                value = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # 负责生成的请求被取消时重新尝试，由某个等待者自己调用factory；本请求被取消时照常抛出
+                if pending.cancelled():
+                    continue
+                raise
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            value = await factory()
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免出现未获取异常的警告
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+        finally:
+            del self._pending[key]
+            # 被取消时不把CancelledError交给等待者，只通知它们重新尝试
+            if not future.done():
+                future.cancel()
+
+        self._entries[key] = value
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        """清空缓存"""
+        self._entries.clear()
+
+    def get_hit_rate(self) -> float:
+        """获取缓存命中率"""
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -2,17 +2,21 @@
 检查Python文件语法正确性
 """
 
-import ast
 import sys
+from multiprocessing import Pool
 from pathlib import Path
 
+# 文件数超过该值时才使用多进程，文件较少时进程启动开销大于并行收益
+PARALLEL_MIN_FILES = 200
+
 def check_syntax(file_path):
     """检查单个文件的语法"""
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
             source = f.read()
 
-        ast.parse(source, filename=str(file_path))
+        # 直接编译而不构建AST对象，也不像py_compile那样写出.pyc文件
+        compile(source, str(file_path), "exec", dont_inherit=True)
         return True, None
     except SyntaxError as e:
         return False, f"语法错误: {e}"
@@ -21,24 +25,23 @@ def check_syntax(file_path):
 
 def check_all_files():
     """检查所有Python文件"""
-    python_files = []
-
-    # 收集所有Python文件
-    for pattern in ["*.py", "**/*.py"]:
-        python_files.extend(Path(".").glob(pattern))
-
-    # 排除一些文件
-    exclude_patterns = ["__pycache__", ".git", "venv", "env"]
-    python_files = [f for f in python_files
-                   if not any(pattern in str(f) for pattern in exclude_patterns)]
+    # 收集所有Python文件（"**/*.py"已包含顶层文件），按路径中的目录名排除
+    exclude_dirs = {"__pycache__", ".git", "venv", "env"}
+    python_files = [f for f in Path(".").rglob("*.py") if exclude_dirs.isdisjoint(f.parts)]
 
     print(f"检查 {len(python_files)} 个Python文件...")
 
     errors = []
     success_count = 0
 
-    for file_path in python_files:
-        success, error = check_syntax(file_path)
+    # 各文件相互独立，文件较多时分发到多个进程并行检查，imap保持输出顺序
+    if len(python_files) >= PARALLEL_MIN_FILES:
+        with Pool() as pool:
+            results = list(pool.imap(check_syntax, python_files, chunksize=16))
+    else:
+        results = [check_syntax(file_path) for file_path in python_files]
+
+    for file_path, (success, error) in zip(python_files, results):
         if success:
             success_count += 1
             print(f"✅ {file_path}")
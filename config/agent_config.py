@@ -3,13 +3,20 @@
 提供智能体配置的加载、验证和管理功能
 """
 
+import copy
 import json
 import yaml
 import logging
 import os
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from pathlib import Path
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, is_dataclass
+
+# 优先使用基于libyaml的C实现，未编译libyaml时回退到纯Python实现
+try:
+    from yaml import CSafeLoader as YamlLoader, CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeLoader as YamlLoader, SafeDumper as YamlDumper
 
 import sys
 from pathlib import Path
@@ -18,6 +25,14 @@ sys.path.append(str(Path(__file__).parent.parent))
 from agents.base.agent_interface import AgentType
 
 
+# 文化智能体类型，需要文化配置
+CULTURAL_AGENT_TYPES = frozenset({
+    AgentType.CULTURAL_CHRISTIAN, AgentType.CULTURAL_ISLAMIC,
+    AgentType.CULTURAL_BUDDHIST, AgentType.CULTURAL_HINDU,
+    AgentType.CULTURAL_TRADITIONAL
+})
+
+
 @dataclass
 class ModelConfig:
     """模型配置"""
@@ -28,6 +43,10 @@ class ModelConfig:
     max_new_tokens: int = 512
     temperature: float = 0.0
     max_input_length: int = 2048
+    quantization: str = "bf16"  # bf16 / nf4 / int8
+    attn_impl: str = "auto"  # auto / flash_attention_2 / sdpa / eager
+    compile: bool = False  # 使用torch.compile(mode="reduce-overhead")编译模型并以静态KV缓存生成（不复用前缀KV缓存），仅CUDA下生效
+    api_base: str = ""  # OpenAI兼容推理服务地址（如vllm serve的 http://host:8000/v1），非空时不在本进程加载模型
 
 
 @dataclass
@@ -52,6 +71,9 @@ class AgentConfig:
 class AgentConfigManager:
     """智能体配置管理器"""
 
+    # 已解析的YAML文件，按 (修改时间, 文件大小) 校验，在所有管理器实例之间共享
+    _yaml_cache: Dict[Path, Tuple[Tuple[int, int], Any]] = {}
+
     def __init__(self, config_dir: str = "config"):
         self.config_dir = Path(config_dir)
         self.logger = logging.getLogger("AgentConfigManager")
@@ -63,9 +85,33 @@ class AgentConfigManager:
         self.agent_configs: Dict[AgentType, AgentConfig] = {}
         self.global_config: Dict[str, Any] = {}
 
-        # 加载配置
+        # 加载配置，智能体配置在首次获取时才加载
         self._load_global_config()
-        self._load_agent_configs()
+
+    @classmethod
+    def _load_yaml(cls, path: Path) -> Any:
+        """读取YAML文件，文件未修改时复用已解析的结果；返回副本，调用方可以自由修改"""
+        stat = path.stat()
+        version = (stat.st_mtime_ns, stat.st_size)
+        key = path.resolve()
+
+        cached = cls._yaml_cache.get(key)
+        if cached is None or cached[0] != version:
+            with open(path, 'r', encoding='utf-8') as f:
+                cached = cls._yaml_cache[key] = (version, yaml.load(f, Loader=YamlLoader))
+
+        return copy.deepcopy(cached[1])
+
+    @staticmethod
+    def _dump_yaml(data: Any, path: Path):
+        """写入YAML文件，.json后缀时写入JSON；先写临时文件再替换，中途失败不会留下不完整的文件"""
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            if path.suffix == ".json":
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            else:
+                yaml.dump(data, f, Dumper=YamlDumper, default_flow_style=False, allow_unicode=True)
+        os.replace(tmp_path, path)
 
     def _load_global_config(self):
         """加载全局配置"""
@@ -73,8 +119,7 @@ class AgentConfigManager:
 
         if global_config_path.exists():
             try:
-                with open(global_config_path, 'r', encoding='utf-8') as f:
-                    self.global_config = yaml.safe_load(f)
+                self.global_config = self._load_yaml(global_config_path)
                 self.logger.info("全局配置加载成功")
             except Exception as e:
                 self.logger.error(f"加载全局配置失败: {str(e)}")
@@ -91,6 +136,9 @@ class AgentConfigManager:
             "max_active_agents": 3,
             "idle_timeout": 300.0,
             "memory_threshold": 0.8,
+            "max_concurrent_loads": 1,
+            "max_concurrent_debates": 4,
+            "max_conversation_contexts": 100,
             "message_bus": {
                 "max_queue_size": 1000,
                 "message_timeout": 30.0,
@@ -106,78 +154,39 @@ class AgentConfigManager:
         """保存全局配置"""
         try:
             global_config_path = self.config_dir / "global_config.yaml"
-            with open(global_config_path, 'w', encoding='utf-8') as f:
-                yaml.dump(self.global_config, f, default_flow_style=False, allow_unicode=True)
+            self._dump_yaml(self.global_config, global_config_path)
             self.logger.info("全局配置保存成功")
         except Exception as e:
             self.logger.error(f"保存全局配置失败: {str(e)}")
 
     def _load_agent_configs(self):
         """加载所有智能体配置"""
-        # 加载文化智能体配置
-        cultural_agents = [
-            AgentType.CULTURAL_CHRISTIAN,
-            AgentType.CULTURAL_ISLAMIC,
-            AgentType.CULTURAL_BUDDHIST,
-            AgentType.CULTURAL_HINDU,
-            AgentType.CULTURAL_TRADITIONAL
-        ]
-
-        for agent_type in cultural_agents:
-            config = self._load_cultural_agent_config(agent_type)
-            if config:
-                self.agent_configs[agent_type] = config
-
-        # 加载其他智能体配置
-        other_agents = [
-            AgentType.CONFLICT_DETECTOR,
-            AgentType.MEDIATOR,
-            AgentType.DECISION_MAKER
-        ]
+        for agent_type in AgentType:
+            self.get_agent_config(agent_type)
 
-        for agent_type in other_agents:
-            config = self._load_other_agent_config(agent_type)
-            if config:
-                self.agent_configs[agent_type] = config
-
-    def _load_cultural_agent_config(self, agent_type: AgentType) -> Optional[AgentConfig]:
-        """加载文化智能体配置"""
+    def _load_agent_config(self, agent_type: AgentType) -> Optional[AgentConfig]:
+        """加载智能体配置，配置文件不存在或无法解析时创建默认配置"""
         config_file = self.config_dir / f"{agent_type.value}_config.yaml"
 
         if config_file.exists():
             try:
-                with open(config_file, 'r', encoding='utf-8') as f:
-                    config_data = yaml.safe_load(f)
+                config_data = self._load_yaml(config_file)
                 return self._parse_agent_config(agent_type, config_data)
             except Exception as e:
                 self.logger.error(f"加载 {agent_type.value} 配置失败: {str(e)}")
 
         # 创建默认配置
-        default_config = self._get_default_cultural_config(agent_type)
-        self._save_agent_config(agent_type, default_config)
-        return default_config
-
-    def _load_other_agent_config(self, agent_type: AgentType) -> Optional[AgentConfig]:
-        """加载其他智能体配置"""
-        config_file = self.config_dir / f"{agent_type.value}_config.yaml"
-
-        if config_file.exists():
-            try:
-                with open(config_file, 'r', encoding='utf-8') as f:
-                    config_data = yaml.safe_load(f)
-                return self._parse_agent_config(agent_type, config_data)
-            except Exception as e:
-                self.logger.error(f"加载 {agent_type.value} 配置失败: {str(e)}")
-
-        # 创建默认配置
-        default_config = self._get_default_other_config(agent_type)
+        if agent_type in CULTURAL_AGENT_TYPES:
+            default_config = self._get_default_cultural_config(agent_type)
+        else:
+            default_config = self._get_default_other_config(agent_type)
         self._save_agent_config(agent_type, default_config)
         return default_config
 
     def _parse_agent_config(self, agent_type: AgentType, config_data: Dict[str, Any]) -> AgentConfig:
         """解析智能体配置"""
-        # 解析模型配置
-        model_data = config_data.get("model", {})
+        # 解析模型配置，兼容旧版按 asdict 写出的 model_config 等键
+        model_data = config_data.get("model", config_data.get("model_config")) or {}
         model_config = ModelConfig(
             model_id=model_data.get("model_id", "meta-llama/Meta-Llama-3-8B-Instruct"),
             cache_dir=model_data.get("cache_dir", self.global_config.get("cache_dir", "")),
@@ -185,13 +194,17 @@ class AgentConfigManager:
             device_map=model_data.get("device_map", "auto"),
             max_new_tokens=model_data.get("max_new_tokens", 512),
             temperature=model_data.get("temperature", 0.0),
-            max_input_length=model_data.get("max_input_length", 2048)
+            max_input_length=model_data.get("max_input_length", 2048),
+            quantization=model_data.get("quantization", "bf16"),
+            attn_impl=model_data.get("attn_impl", "auto"),
+            compile=model_data.get("compile", False),
+            api_base=model_data.get("api_base", "")
         )
 
         # 解析文化配置（如果存在）
         cultural_config = None
-        if "cultural" in config_data:
-            cultural_data = config_data["cultural"]
+        cultural_data = config_data.get("cultural", config_data.get("cultural_config"))
+        if cultural_data:
             cultural_config = CulturalConfig(
                 cultural_values=cultural_data.get("cultural_values", []),
                 social_norms=cultural_data.get("social_norms", {}),
@@ -204,9 +217,21 @@ class AgentConfigManager:
             agent_type=agent_type.value,
             model_config=model_config,
             cultural_config=cultural_config,
-            custom_config=config_data.get("custom", {})
+            custom_config=config_data.get("custom", config_data.get("custom_config")) or {}
         )
 
+    @staticmethod
+    def _serialize_agent_config(config: AgentConfig) -> Dict[str, Any]:
+        """将智能体配置转换为与 _parse_agent_config 对应的字典结构"""
+        config_data = {
+            "agent_type": config.agent_type,
+            "model": asdict(config.model_config),
+            "custom": config.custom_config or {}
+        }
+        if config.cultural_config:
+            config_data["cultural"] = asdict(config.cultural_config)
+        return config_data
+
     def _get_default_cultural_config(self, agent_type: AgentType) -> AgentConfig:
         """获取默认文化智能体配置"""
         # 根据智能体类型设置不同的模型
@@ -296,18 +321,20 @@ class AgentConfigManager:
         """保存智能体配置"""
         try:
             config_file = self.config_dir / f"{agent_type.value}_config.yaml"
-            config_dict = asdict(config)
-
-            with open(config_file, 'w', encoding='utf-8') as f:
-                yaml.dump(config_dict, f, default_flow_style=False, allow_unicode=True)
+            self._dump_yaml(self._serialize_agent_config(config), config_file)
 
             self.logger.info(f"智能体配置保存成功: {agent_type.value}")
         except Exception as e:
             self.logger.error(f"保存智能体配置失败: {str(e)}")
 
     def get_agent_config(self, agent_type: AgentType) -> Optional[AgentConfig]:
-        """获取智能体配置"""
-        return self.agent_configs.get(agent_type)
+        """获取智能体配置，首次获取时从文件加载"""
+        config = self.agent_configs.get(agent_type)
+        if config is None:
+            config = self._load_agent_config(agent_type)
+            if config:
+                self.agent_configs[agent_type] = config
+        return config
 
     def get_global_config(self) -> Dict[str, Any]:
         """获取全局配置"""
@@ -320,11 +347,28 @@ class AgentConfigManager:
 
     def update_agent_config(self, agent_type: AgentType, updates: Dict[str, Any]):
         """更新智能体配置"""
-        if agent_type in self.agent_configs:
-            config = self.agent_configs[agent_type]
-            # 这里可以实现更复杂的配置更新逻辑
+        config = self.get_agent_config(agent_type)
+        # 只有字段实际发生变化时才写回文件
+        if config and self._apply_updates(config, updates):
             self._save_agent_config(agent_type, config)
 
+    def _apply_updates(self, target: Any, updates: Dict[str, Any]) -> bool:
+        """将更新写入配置对象，嵌套配置按字段递归更新，返回是否有字段发生变化"""
+        changed = False
+        for key, value in updates.items():
+            if not hasattr(target, key):
+                self.logger.warning("未知的配置项: %s", key)
+                continue
+
+            current = getattr(target, key)
+            if is_dataclass(current) and isinstance(value, dict):
+                changed = self._apply_updates(current, value) or changed
+            elif current != value:
+                setattr(target, key, value)
+                changed = True
+
+        return changed
+
     def validate_config(self, agent_type: AgentType) -> bool:
         """验证智能体配置"""
         config = self.get_agent_config(agent_type)
@@ -337,7 +381,7 @@ class AgentConfigManager:
             return False
 
         # 验证文化配置（如果需要）
-        if agent_type.value.startswith("cultural_") and not config.cultural_config:
+        if agent_type in CULTURAL_AGENT_TYPES and not config.cultural_config:
             self.logger.error(f"文化智能体 {agent_type.value} 缺少文化配置")
             return False
 
@@ -345,21 +389,22 @@ class AgentConfigManager:
 
     def get_all_agent_types(self) -> List[AgentType]:
         """获取所有已配置的智能体类型"""
+        self._load_agent_configs()
         return list(self.agent_configs.keys())
 
     def export_config(self, output_file: str):
         """导出配置到文件"""
         try:
+            self._load_agent_configs()
             export_data = {
                 "global_config": self.global_config,
                 "agent_configs": {
-                    agent_type.value: asdict(config)
+                    agent_type.value: self._serialize_agent_config(config)
                     for agent_type, config in self.agent_configs.items()
                 }
             }
 
-            with open(output_file, 'w', encoding='utf-8') as f:
-                yaml.dump(export_data, f, default_flow_style=False, allow_unicode=True)
+            self._dump_yaml(export_data, Path(output_file))
 
             self.logger.info(f"配置导出成功: {output_file}")
         except Exception as e:
@@ -368,8 +413,13 @@ class AgentConfigManager:
     def import_config(self, input_file: str):
         """从文件导入配置"""
         try:
-            with open(input_file, 'r', encoding='utf-8') as f:
-                import_data = yaml.safe_load(f)
+            input_path = Path(input_file)
+            if input_path.suffix == ".json":
+                # JSON解析比YAML快得多，导出的配置都可以用JSON表示
+                with open(input_path, 'r', encoding='utf-8') as f:
+                    import_data = json.load(f)
+            else:
+                import_data = self._load_yaml(input_path)
 
             if "global_config" in import_data:
                 self.global_config.update(import_data["global_config"])
@@ -1,10 +1,12 @@
-import torch
+import asyncio
 import datetime
 import jsonlines
 import os
 import argparse
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+import torch
 from huggingface_hub.hf_api import HfFolder
+from tqdm import tqdm
+from vllm import AsyncEngineArgs, AsyncLLMEngine, SamplingParams, TokensPrompt
 from prompt import prompts
 from utils import country_capitalized_mapping, parse_final_answer, parse_response
 
@@ -32,8 +34,150 @@ llama_local_path = "/root/autodl-tmp/CultureMoE/Culture_Alignment/Meta-Llama-3.1
 llama_hub_path = "meta-llama/Meta-Llama-3.1-8B-Instruct"
 model2_id = select_model_path(llama_local_path, llama_hub_path, "LLaMA3.1")
 
+# 同时辩论的最大数据条数，限制在途序列的KV缓存占用
+MAX_INFLIGHT_ITEMS = 64
+
+# vLLM的引擎核心和张量并行worker运行在创建引擎时启动的子进程中，继承当时的CUDA_VISIBLE_DEVICES，
+# 因此两个引擎可以在同一进程中分别绑定到不相交的GPU上
+os.environ.setdefault("VLLM_ENABLE_V1_MULTIPROCESSING", "1")
+
+# 投机解码配置（--speculative开启）：LLaMA3.1使用同词表的LLaMA3.2-1B作为草稿模型；
+# Qwen2.5-7B的词表大小与小尺寸Qwen2.5不同，改用从prompt中查找n-gram的方式提出候选token
+SPECULATIVE_CONFIGS = {
+    "qwen": {"method": "ngram", "num_speculative_tokens": 5, "prompt_lookup_max": 4},
+    "llama": {"model": "meta-llama/Llama-3.2-1B-Instruct", "num_speculative_tokens": 5},
+}
+
+
+def visible_gpus():
+    """获取当前可见的GPU编号"""
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if visible is not None:
+        return [gpu.strip() for gpu in visible.split(",") if gpu.strip()]
+    return [str(i) for i in range(torch.cuda.device_count())]
+
+
+def split_gpus(gpus):
+    """两个引擎各分得一半GPU，互不重叠；只有一块GPU时两者共用"""
+    if len(gpus) < 2:
+        return gpus, gpus
+    half = len(gpus) // 2
+    return gpus[:half], gpus[half:2 * half]
+
+
+def tensor_parallel_size(num_gpus):
+    """并行度需整除注意力头数（Qwen2.5-7B为28，LLaMA3.1-8B为32），取不超过GPU数的1/2/4"""
+    return max(n for n in (1, 2, 4) if n <= max(num_gpus, 1))
+
+
+def load_engine(model_id, gpus, shared, speculative_config=None, quantization=None):
+    """在指定GPU上创建vLLM异步引擎，按张量并行切分；与另一个引擎共用GPU时各占约一半显存"""
+    tp_size = tensor_parallel_size(len(gpus))
+    engine_args = AsyncEngineArgs(
+        model=model_id,
+        dtype="bfloat16",
+        quantization=quantization,
+        tensor_parallel_size=tp_size,
+        # 同一条数据第2、3轮的prompt共享从Task到Discussant回应的整段前缀，缓存后第3轮只需prefill新增的反馈部分
+        enable_prefix_caching=True,
+        speculative_config=speculative_config,
+        download_dir=own_cache_dir or None,
+        gpu_memory_utilization=0.45 if shared else 0.9
+    )
 
-def main():
+    if not gpus:
+        return AsyncLLMEngine.from_engine_args(engine_args)
+
+    # 只在创建引擎期间修改CUDA_VISIBLE_DEVICES，引擎的子进程据此只看到分配给它的GPU
+    previous = os.environ.get("CUDA_VISIBLE_DEVICES")
+    os.environ["CUDA_VISIBLE_DEVICES"] = ",".join(gpus[:tp_size])
+    try:
+        return AsyncLLMEngine.from_engine_args(engine_args)
+    finally:
+        if previous is None:
+            del os.environ["CUDA_VISIBLE_DEVICES"]
+        else:
+            os.environ["CUDA_VISIBLE_DEVICES"] = previous
+
+
+async def generate(engine, tokenizer, prompt, sampling_params, request_id):
+    """对单个prompt应用chat template并生成，消费异步迭代器返回最终文本"""
+    # 尝试使用chat template，如果不支持则直接使用原始prompt
+    # chat template的输出已包含BOS，直接传token id，避免引擎再次添加
+    try:
+        engine_prompt = TokensPrompt(prompt_token_ids=tokenizer.apply_chat_template(
+            [{"role": "user", "content": prompt}],
+            tokenize=True,
+            add_generation_prompt=True
+        ))
+    except Exception:
+        engine_prompt = prompt
+    final_output = None
+    async for output in engine.generate(engine_prompt, sampling_params, request_id=request_id):
+        final_output = output
+    return final_output.outputs[0].text
+
+
+async def debate_item(i, line, engines, tokenizers, sampling_params, semaphore, verbose=False):
+    """单条数据的三轮辩论，各阶段依次执行，阶段内两个模型同时生成"""
+    engine1, engine2 = engines
+    tokenizer1, tokenizer2 = tokenizers
+    country = country_capitalized_mapping[line['Country']]
+    story = line['Story']
+    rule = line['Rule-of-Thumb']
+
+    async with semaphore:
+        # [1] Qwen2.5 / [2] LLaMA3.1 - Make initial decision
+        prompt_1 = prompts["prompt_1"].replace("{{country}}", country).replace("{{story}}", story).replace("{{rule}}", rule)
+        output1_1, output2_1 = await asyncio.gather(
+            generate(engine1, tokenizer1, prompt_1, sampling_params, f"q-{i}-1"),
+            generate(engine2, tokenizer2, prompt_1, sampling_params, f"l-{i}-1")
+        )
+        generation1_1 = parse_response(output1_1, "Answer:")
+        generation2_1 = parse_response(output2_1, "Answer:")
+
+        # [3] Qwen2.5 - Give feedback to LLaMA3.1 / [4] LLaMA3.1 - Give feedback to Qwen2.5
+        prompt_2 = prompts["prompt_2"].replace("{{country}}", country).replace("{{story}}", story).replace("{{rule}}", rule)
+        prompt1_2 = prompt_2.replace("{{other_response}}", generation2_1).replace("{{your_response}}", generation1_1)
+        prompt2_2 = prompt_2.replace("{{other_response}}", generation1_1).replace("{{your_response}}", generation2_1)
+        output1_2, output2_2 = await asyncio.gather(
+            generate(engine1, tokenizer1, prompt1_2, sampling_params, f"q-{i}-2"),
+            generate(engine2, tokenizer2, prompt2_2, sampling_params, f"l-{i}-2")
+        )
+        generation1_2 = parse_response(output1_2, "Response:")
+        generation2_2 = parse_response(output2_2, "Response:")
+
+        # [5] Qwen2.5 / [6] LLaMA3.1 - Make final decision
+        prompt_3 = prompts["prompt_3"].replace("{{country}}", country).replace("{{story}}", story).replace("{{rule}}", rule)
+        prompt1_3 = prompt_3.replace("{{other_feedback}}", generation2_2).replace("{{your_feedback}}", generation1_2).replace("{{your_response}}", generation1_1).replace("{{other_response}}", generation2_1)
+        prompt2_3 = prompt_3.replace("{{other_feedback}}", generation1_2).replace("{{your_feedback}}", generation2_2).replace("{{your_response}}", generation2_1).replace("{{other_response}}", generation1_1)
+        output1_3, output2_3 = await asyncio.gather(
+            generate(engine1, tokenizer1, prompt1_3, sampling_params, f"q-{i}-3"),
+            generate(engine2, tokenizer2, prompt2_3, sampling_params, f"l-{i}-3")
+        )
+        generation1_3 = parse_final_answer(output1_3)
+        generation2_3 = parse_final_answer(output2_3)
+
+    if verbose:
+        # 通过tqdm.write输出，不打断进度条
+        tqdm.write(f"\n处理国家: {country}")
+        tqdm.write(f"故事: {story[:100]}...")
+        tqdm.write(f"Gold > {line['Gold Label']}")
+        tqdm.write(f"Qwen2.5 > {generation1_3}")
+        tqdm.write(f"LLaMA3.1 > {generation2_3}")
+        tqdm.write("\n======================================================\n")
+
+    # 保存结果
+    line[f"qwen25_1"] = generation1_1
+    line[f"llama31_1"] = generation2_1
+    line[f"qwen25_2"] = generation1_2
+    line[f"llama31_2"] = generation2_2
+    line[f"qwen25_final"] = generation1_3
+    line[f"llama31_final"] = generation2_3
+    return line
+
+
+async def main():
     start_time = datetime.datetime.now()
 
     hf_token = ""
@@ -43,171 +187,69 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--input_path", type=str)
     parser.add_argument("--output_path", type=str)
+    parser.add_argument("--speculative", action="store_true",
+                        help="开启投机解码；在途数据较少时降低解码延迟，批次较大时可能降低吞吐")
+    parser.add_argument("--quantization", type=str, default=None, choices=["fp8"],
+                        help="权重量化方式，默认不量化（bf16）；fp8在加载时将bf16权重动态量化为FP8，权重显存和解码带宽减半，但结果可能与bf16不同")
+    parser.add_argument("--verbose", action="store_true",
+                        help="逐条输出每条数据的辩论结果，默认只显示进度条")
 
     args = parser.parse_args()
 
     # =========================================== Model Loading ===========================================
-    print("正在加载Qwen2.5模型...")
-    tokenizer1 = AutoTokenizer.from_pretrained(model1_id, cache_dir=own_cache_dir)
-    model1 = AutoModelForCausalLM.from_pretrained(
-        model1_id,
-        torch_dtype=torch.bfloat16,
-        cache_dir=own_cache_dir,
-        device_map="auto",
-    )
+    # vLLM按步调度所有在途请求，PagedAttention管理KV缓存
+    # 两个模型分别使用不相交的GPU组，每个引擎在自己的GPU组内做张量并行
+    gpus1, gpus2 = split_gpus(visible_gpus())
+    shared = gpus1 == gpus2
 
-    print("正在加载LLaMA3.1模型...")
-    tokenizer2 = AutoTokenizer.from_pretrained(model2_id, cache_dir=own_cache_dir)
-    model2 = AutoModelForCausalLM.from_pretrained(
-        model2_id,
-        torch_dtype=torch.bfloat16,
-        cache_dir=own_cache_dir,
-        device_map="auto",
-    )
+    print(f"正在加载Qwen2.5模型... GPU: {','.join(gpus1) or 'N/A'}")
+    engine1 = load_engine(model1_id, gpus1, shared, SPECULATIVE_CONFIGS["qwen"] if args.speculative else None,
+                          args.quantization)
+    tokenizer1 = await engine1.get_tokenizer()
+
+    print(f"正在加载LLaMA3.1模型... GPU: {','.join(gpus2) or 'N/A'}")
+    engine2 = load_engine(model2_id, gpus2, shared, SPECULATIVE_CONFIGS["llama"] if args.speculative else None,
+                          args.quantization)
+    tokenizer2 = await engine2.get_tokenizer()
+
+    # 贪心解码；LLaMA3.1的<|eot_id|>等结束符由模型的generation_config提供
+    sampling_params = SamplingParams(temperature=0.0, max_tokens=1024)
 
     print("模型加载完成，开始处理数据...")
 
     # =========================================== Load Dataset ===========================================
-    generations1, generations2 = [], []
-
-    with jsonlines.open(args.output_path, mode="w") as outfile:
-        with jsonlines.open(args.input_path) as file:
-            for line in file.iter():
-                country_small = line['Country']
-                country = country_capitalized_mapping[country_small]
-                story = line['Story']
-                rule = line['Rule-of-Thumb']
-                gold_label = line["Gold Label"]
-
-                print(f"\n处理国家: {country}")
-                print(f"故事: {story[:100]}...")
-
-                # [1] Model1 (Qwen2.5) - Make initial decision
-                print("[1] Qwen2.5 - Make initial decision")
-                prompt1_1 = prompts["prompt_1"].replace("{{country}}", country).replace("{{story}}", story).replace("{{rule}}", rule)
-                print(prompt1_1)
-
-                # 尝试使用chat template，如果不支持则使用直接编码
-                try:
-                    messages1 = [{"role": "user", "content": prompt1_1}]
-                    input_ids1 = tokenizer1.apply_chat_template(messages1, add_generation_prompt=True, return_tensors="pt").to(model1.device)
-                    outputs1 = model1.generate(input_ids1, max_new_tokens=1024, do_sample=False, temperature=0.0)
-                    response1 = outputs1[0][input_ids1.shape[-1]:]
-                    generation1_1 = tokenizer1.decode(response1, skip_special_tokens=True)
-                except:
-                    # 回退到直接编码方式
-                    input_ids1 = tokenizer1(prompt1_1, return_tensors="pt").to(model1.device)
-                    outputs1 = model1.generate(**input_ids1, max_new_tokens=1024, temperature=0.0)
-                    generation1_1 = tokenizer1.decode(outputs1[0])
-
-                generation1_1 = parse_response(generation1_1, "Answer:")
-                print(f">>> {generation1_1}")
-                print("-----------------------------------------------------")
-
-                # [2] Model2 (LLaMA3.1) - Make initial decision
-                print("[2] LLaMA3.1 - Make initial decision")
-                prompt2_1 = prompts["prompt_1"].replace("{{country}}", country).replace("{{story}}", story).replace("{{rule}}", rule)
-                print(prompt2_1)
-                messages2 = [{"role": "user", "content": prompt2_1}]
-                input_ids2 = tokenizer2.apply_chat_template(messages2, add_generation_prompt=True, return_tensors="pt").to(model2.device)
-
-                # LLaMA3.1的特殊terminators
-                terminators = [tokenizer2.eos_token_id]
-                if tokenizer2.convert_tokens_to_ids("<|eot_id|>") != tokenizer2.unk_token_id:
-                    terminators.append(tokenizer2.convert_tokens_to_ids("<|eot_id|>"))
-
-                outputs2 = model2.generate(input_ids2, max_new_tokens=1024, eos_token_id=terminators, do_sample=False, temperature=0.0)
-                response2 = outputs2[0][input_ids2.shape[-1]:]
-                generation2_1 = tokenizer2.decode(response2, skip_special_tokens=True)
-                generation2_1 = parse_response(generation2_1, "Answer:")
-                print(f">>> {generation2_1}")
-                print("-----------------------------------------------------")
-
-                # [3] Model1 (Qwen2.5) - Give feedback to LLaMA3.1
-                print("[3] Qwen2.5 - Give feedback to LLaMA3.1")
-                prompt1_2 = prompts["prompt_2"].replace("{{country}}", country).replace("{{story}}", story).replace("{{rule}}", rule).replace("{{other_response}}", generation2_1).replace("{{your_response}}", generation1_1)
-                print(prompt1_2)
-
-                try:
-                    messages1_2 = [{"role": "user", "content": prompt1_2}]
-                    input_ids1_2 = tokenizer1.apply_chat_template(messages1_2, add_generation_prompt=True, return_tensors="pt").to(model1.device)
-                    outputs1_2 = model1.generate(input_ids1_2, max_new_tokens=1024, do_sample=False, temperature=0.0)
-                    response1_2 = outputs1_2[0][input_ids1_2.shape[-1]:]
-                    generation1_2 = tokenizer1.decode(response1_2, skip_special_tokens=True)
-                except:
-                    input_ids1_2 = tokenizer1(prompt1_2, return_tensors="pt").to(model1.device)
-                    outputs1_2 = model1.generate(**input_ids1_2, max_new_tokens=1024, temperature=0.0)
-                    generation1_2 = tokenizer1.decode(outputs1_2[0])
-
-                generation1_2 = parse_response(generation1_2, "Response:")
-                print(f">>> {generation1_2}")
-                print("-----------------------------------------------------")
-
-                # [4] Model2 (LLaMA3.1) - Give feedback to Qwen2.5
-                print("[4] LLaMA3.1 - Give feedback to Qwen2.5")
-                prompt2_2 = prompts["prompt_2"].replace("{{country}}", country).replace("{{story}}", story).replace("{{rule}}", rule).replace("{{other_response}}", generation1_1).replace("{{your_response}}", generation2_1)
-                print(prompt2_2)
-                messages2_2 = [{"role": "user", "content": prompt2_2}]
-                input_ids2_2 = tokenizer2.apply_chat_template(messages2_2, add_generation_prompt=True, return_tensors="pt").to(model2.device)
-                outputs2_2 = model2.generate(input_ids2_2, max_new_tokens=1024, eos_token_id=terminators, do_sample=False, temperature=0.0)
-                response2_2 = outputs2_2[0][input_ids2_2.shape[-1]:]
-                generation2_2 = tokenizer2.decode(response2_2, skip_special_tokens=True)
-                generation2_2 = parse_response(generation2_2, "Response:")
-                print(f">>> {generation2_2}")
-                print("-----------------------------------------------------")
-
-                # [5] Model1 (Qwen2.5) - Make final decision
-                print("[5] Qwen2.5 - Make final decision")
-                prompt1_3 = prompts["prompt_3"].replace("{{country}}", country).replace("{{story}}", story).replace("{{rule}}", rule).replace("{{other_feedback}}", generation2_2).replace("{{your_feedback}}", generation1_2).replace("{{your_response}}", generation1_1).replace("{{other_response}}", generation2_1)
-                print(prompt1_3)
-
-                try:
-                    messages1_3 = [{"role": "user", "content": prompt1_3}]
-                    input_ids1_3 = tokenizer1.apply_chat_template(messages1_3, add_generation_prompt=True, return_tensors="pt").to(model1.device)
-                    outputs1_3 = model1.generate(input_ids1_3, max_new_tokens=1024, do_sample=False, temperature=0.0)
-                    response1_3 = outputs1_3[0][input_ids1_3.shape[-1]:]
-                    generation1_3 = tokenizer1.decode(response1_3, skip_special_tokens=True)
-                except:
-                    input_ids1_3 = tokenizer1(prompt1_3, return_tensors="pt").to(model1.device)
-                    outputs1_3 = model1.generate(**input_ids1_3, max_new_tokens=1024, temperature=0.0)
-                    generation1_3 = tokenizer1.decode(outputs1_3[0])
-
-                generation1_3 = parse_final_answer(generation1_3)
-                print(f">>> {generation1_3}")
-                print("-----------------------------------------------------")
-
-                # [6] Model2 (LLaMA3.1) - Make final decision
-                print("[6] LLaMA3.1 - Make final decision")
-                prompt2_3 = prompts["prompt_3"].replace("{{country}}", country).replace("{{story}}", story).replace("{{rule}}", rule).replace("{{other_feedback}}", generation1_2).replace("{{your_feedback}}", generation2_2).replace("{{your_response}}", generation2_1).replace("{{other_response}}", generation1_1)
-                print(prompt2_3)
-                messages2_3 = [{"role": "user", "content": prompt2_3}]
-                input_ids2_3 = tokenizer2.apply_chat_template(messages2_3, add_generation_prompt=True, return_tensors="pt").to(model2.device)
-                outputs2_3 = model2.generate(input_ids2_3, max_new_tokens=1024, eos_token_id=terminators, do_sample=False, temperature=0.0)
-                response2_3 = outputs2_3[0][input_ids2_3.shape[-1]:]
-                generation2_3 = tokenizer2.decode(response2_3, skip_special_tokens=True)
-                generation2_3 = parse_final_answer(generation2_3)
-                print(f">>> {generation2_3}")
-                print("-----------------------------------------------------")
-
-                print(f"Gold > {gold_label}")
-                print(f"Qwen2.5 > {generation1_3}")
-                print(f"LLaMA3.1 > {generation2_3}")
-                print("\n======================================================\n")
-                generations1.append(generation1_3)
-                generations2.append(generation2_3)
-
-                # 保存结果
-                line[f"qwen25_1"] = generation1_1
-                line[f"llama31_1"] = generation2_1
-                line[f"qwen25_2"] = generation1_2
-                line[f"llama31_2"] = generation2_2
-                line[f"qwen25_final"] = generation1_3
-                line[f"llama31_final"] = generation2_3
-                outfile.write(line)
+    with jsonlines.open(args.input_path) as file:
+        lines = list(file.iter())
+    print(f"共 {len(lines)} 条数据，最多 {MAX_INFLIGHT_ITEMS} 条同时辩论")
+
+    # =========================================== Debate ===========================================
+    # 每条数据的各阶段依次执行，不同数据之间互不等待：某条数据上一阶段完成后立即提交下一阶段，
+    # 引擎每一步都能把所有在途数据的序列合并到同一批次中
+    semaphore = asyncio.Semaphore(MAX_INFLIGHT_ITEMS)
+    progress = tqdm(total=len(lines), desc="Debate")
+    results = [None] * len(lines)
+    next_to_write = 0
+
+    async def run_item(i, line):
+        nonlocal next_to_write
+        results[i] = await debate_item(
+            i, line, (engine1, engine2), (tokenizer1, tokenizer2), sampling_params, semaphore, args.verbose
+        )
+        progress.update(1)
+
+        # 按输入顺序追加写入：前面的数据都已完成时才写出，中途中断时已完成的结果不会丢失
+        while next_to_write < len(results) and results[next_to_write] is not None:
+            outfile.write(results[next_to_write])
+            next_to_write += 1
+
+    # =========================================== Save Results ===========================================
+    with jsonlines.open(args.output_path, mode="w", flush=True) as outfile:
+        await asyncio.gather(*[run_item(i, line) for i, line in enumerate(lines)])
+    progress.close()
 
     end_time = datetime.datetime.now()
     print(f"处理完成，总耗时: {end_time - start_time}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
@@ -8,6 +8,7 @@ import json
 import logging
 import argparse
 import time
+from collections import Counter
 from pathlib import Path
 from typing import Dict, Any, List
 import sys
@@ -55,34 +56,13 @@ def convert_normad_to_scenario(normad_item: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def extract_final_decisions(debate_result: Dict[str, Any]) -> Dict[str, str]:
-    """提取最终决策结果"""
-    final_decisions = {}
-
-    for agent_type, response in debate_result.get('final_responses', {}).items():
-        parsed_response = response.get('parsed_response', {})
-        answer = parsed_response.get('answer', 'neither')
-        final_decisions[agent_type] = answer
-
-    return final_decisions
-
-
 def calculate_majority_decision(decisions: Dict[str, str]) -> str:
     """计算多数决策"""
     if not decisions:
         return "neither"
 
-    # 统计各答案的频次
-    answer_counts = {}
-    for answer in decisions.values():
-        answer_counts[answer] = answer_counts.get(answer, 0) + 1
-
-    # 找出最多的答案
-    max_count = max(answer_counts.values())
-    majority_answers = [answer for answer, count in answer_counts.items() if count == max_count]
-
-    # 如果有平局，返回第一个
-    return majority_answers[0]
+    # 统计各答案的频次，平局时most_common返回最先出现的答案
+    return Counter(decisions.values()).most_common(1)[0][0]
 
 
 async def process_single_item(mas: MultiAgentSystem, normad_item: Dict[str, Any]) -> Dict[str, Any]:
@@ -93,8 +73,23 @@ async def process_single_item(mas: MultiAgentSystem, normad_item: Dict[str, Any]
         # 启动多智能体辩论
         debate_result = await mas.start_cultural_debate(scenario)
 
-        # 提取最终决策
-        final_decisions = extract_final_decisions(debate_result)
+        # 一次遍历同时提取最终决策和最终回应摘要
+        final_decisions = {}
+        final_summaries = {}
+        for agent_type, resp in debate_result.get("final_responses", {}).items():
+            answer = resp.get("parsed_response", {}).get("answer", "neither")
+            final_decisions[agent_type] = answer
+            final_summaries[agent_type] = {"answer": answer, "confidence": resp["confidence"]}
+
+        initial_summaries = {}
+        for agent_type, resp in debate_result.get("initial_responses", {}).items():
+            parsed = resp["parsed_response"]
+            initial_summaries[agent_type] = {
+                "answer": parsed.get("answer", "neither"),
+                "explanation": parsed.get("explanation", ""),
+                "confidence": resp["confidence"]
+            }
+
         majority_decision = calculate_majority_decision(final_decisions)
 
         # 构建输出结果
@@ -112,22 +107,8 @@ async def process_single_item(mas: MultiAgentSystem, normad_item: Dict[str, Any]
             "Processing_Time": debate_result["duration"],
 
             # 详细响应（可选）
-            "Initial_Responses": {
-                agent_type: {
-                    "answer": resp["parsed_response"].get("answer", "neither"),
-                    "explanation": resp["parsed_response"].get("explanation", ""),
-                    "confidence": resp["confidence"]
-                }
-                for agent_type, resp in debate_result.get("initial_responses", {}).items()
-            },
-
-            "Final_Responses": {
-                agent_type: {
-                    "answer": resp["parsed_response"].get("answer", "neither"),
-                    "confidence": resp["confidence"]
-                }
-                for agent_type, resp in debate_result.get("final_responses", {}).items()
-            }
+            "Initial_Responses": initial_summaries,
+            "Final_Responses": final_summaries
         }
 
         return result
@@ -161,6 +142,8 @@ async def main():
                        help="最大处理数据项数量（用于测试）")
     parser.add_argument("--start_from", type=int, default=0,
                        help="从第几项开始处理")
+    parser.add_argument("--max_concurrency", type=int, default=32,
+                       help="同时处理的最大数据项数量")
 
     args = parser.parse_args()
 
@@ -202,55 +185,59 @@ async def main():
         stats = mas.get_system_stats()
         logger.info(f"系统状态: {json.dumps(stats, indent=2)}")
 
-        # 批量处理
-        results = []
+        # 批量处理：所有数据项同时提交，同时进行的辩论数由多智能体系统限制，
+        # 共享同一模型的智能体可以把不同数据项的生成请求合并到同一批次中
+        results: List[Dict[str, Any]] = [None] * len(process_data)
+        next_to_write = 0
+        semaphore = asyncio.Semaphore(args.max_concurrency)
         start_time = time.time()
 
-        for i, normad_item in enumerate(process_data):
-            item_start = time.time()
-            logger.info(f"处理第 {start_idx + i + 1}/{len(normad_data)} 项 (ID: {normad_item.get('ID')})")
-
-            try:
-                result = await process_single_item(mas, normad_item)
-                results.append(result)
-
-                item_time = time.time() - item_start
-                logger.info(f"项目 {normad_item.get('ID')} 处理完成，耗时 {item_time:.2f}秒")
-
-                # 显示决策结果
-                decisions = result.get("Agent_Decisions", {})
-                majority = result.get("Majority_Decision", "neither")
-                gold_label = result.get("Gold Label", "unknown")
-
-                logger.info(f"  决策: {decisions}")
-                logger.info(f"  多数决策: {majority}, 金标准: {gold_label}")
-
-                # 每10项保存一次中间结果
-                if (i + 1) % 10 == 0:
-                    logger.info(f"保存中间结果... ({i + 1} 项已完成)")
-                    with open(output_path, 'w', encoding='utf-8') as f:
-                        for result in results:
-                            f.write(json.dumps(result, ensure_ascii=False) + '\n')
-
-            except Exception as e:
-                logger.error(f"处理项目 {normad_item.get('ID')} 时发生错误: {str(e)}")
-                # 添加错误记录
-                error_result = {
-                    "ID": normad_item.get("ID"),
-                    "Country": normad_item.get("Country", ""),
-                    "Story": normad_item.get("Story", ""),
-                    "Gold Label": normad_item.get("Gold Label", ""),
-                    "Error": str(e),
-                    "Agent_Decisions": {},
-                    "Majority_Decision": "neither"
-                }
-                results.append(error_result)
-
-        # 保存最终结果
-        logger.info("保存最终结果...")
-        with open(output_path, 'w', encoding='utf-8') as f:
-            for result in results:
-                f.write(json.dumps(result, ensure_ascii=False) + '\n')
+        async def run_item(i: int, normad_item: Dict[str, Any]):
+            """处理一个数据项并记录结果"""
+            nonlocal next_to_write
+
+            async with semaphore:
+                item_start = time.time()
+                logger.info(f"处理第 {start_idx + i + 1}/{len(normad_data)} 项 (ID: {normad_item.get('ID')})")
+
+                try:
+                    result = await process_single_item(mas, normad_item)
+
+                    item_time = time.time() - item_start
+                    logger.info(f"项目 {normad_item.get('ID')} 处理完成，耗时 {item_time:.2f}秒")
+
+                    # 显示决策结果
+                    decisions = result.get("Agent_Decisions", {})
+                    majority = result.get("Majority_Decision", "neither")
+                    gold_label = result.get("Gold Label", "unknown")
+
+                    logger.info(f"  决策: {decisions}")
+                    logger.info(f"  多数决策: {majority}, 金标准: {gold_label}")
+
+                except Exception as e:
+                    logger.error(f"处理项目 {normad_item.get('ID')} 时发生错误: {str(e)}")
+                    # 添加错误记录
+                    result = {
+                        "ID": normad_item.get("ID"),
+                        "Country": normad_item.get("Country", ""),
+                        "Story": normad_item.get("Story", ""),
+                        "Gold Label": normad_item.get("Gold Label", ""),
+                        "Error": str(e),
+                        "Agent_Decisions": {},
+                        "Majority_Decision": "neither"
+                    }
+
+            results[i] = result
+
+            # 按输入顺序追加写入：前面的数据项都已完成时才写出，每10项刷新一次缓冲区
+            while next_to_write < len(results) and results[next_to_write] is not None:
+                outfile.write(json.dumps(results[next_to_write], ensure_ascii=False) + '\n')
+                next_to_write += 1
+                if next_to_write % 10 == 0:
+                    outfile.flush()
+
+        with open(output_path, 'w', encoding='utf-8', buffering=1 << 16) as outfile:
+            await asyncio.gather(*[run_item(i, item) for i, item in enumerate(process_data)])
 
         total_time = time.time() - start_time
         logger.info(f"批量处理完成！")
@@ -302,4 +289,23 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # 安装了uvloop时使用基于libuv的事件循环，并发数据项较多时任务调度开销更低
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+
+    # Python 3.12+ 使用eager任务工厂，能同步完成的协程不再经过一次事件循环调度；
+    # 只在入口处创建的事件循环上设置，不影响作为库使用时调用方的事件循环
+    eager_task_factory = getattr(asyncio, "eager_task_factory", None)
+    if eager_task_factory is None:
+        asyncio.run(main())
+    else:
+        def new_event_loop():
+            loop = asyncio.new_event_loop()
+            loop.set_task_factory(eager_task_factory)
+            return loop
+
+        with asyncio.Runner(loop_factory=new_event_loop) as runner:
+            runner.run(main())
\ No newline at end of file
@@ -8,6 +8,34 @@ import yaml
 import json
 from pathlib import Path
 
+# 优先使用基于libyaml的C实现，未编译libyaml时回退到纯Python实现
+try:
+    from yaml import CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeDumper as YamlDumper
+
+# 各智能体共用的模型配置
+LLAMA3_MODEL_ID = "meta-llama/Meta-Llama-3-8B-Instruct"
+GEMMA2_MODEL_ID = "google/gemma-2-9b-it"
+MODEL_DEFAULTS = {"cache_dir": "./cache", "torch_dtype": "bfloat16"}
+GENERATION_DEFAULTS = {"device_map": "auto", "max_new_tokens": 512, "temperature": 0.0, "max_input_length": 2048}
+
+def write_if_changed(path: Path, content: bytes) -> bool:
+    """内容与现有文件相同时跳过写入，保留修改时间，返回是否写入"""
+    try:
+        if path.read_bytes() == content:
+            return False
+    except FileNotFoundError:
+        pass
+
+    path.write_bytes(content)
+    return True
+
+def dump_yaml_config(config, path: Path) -> bool:
+    """将配置序列化为UTF-8编码的YAML，仅在内容变化时写入"""
+    content = yaml.dump(config, Dumper=YamlDumper, default_flow_style=False, allow_unicode=True, encoding='utf-8')
+    return write_if_changed(path, content)
+
 def create_directories():
     """创建必要的目录"""
     directories = [
@@ -41,25 +69,17 @@ def create_global_config():
     }
 
     config_path = Path("config/global_config.yaml")
-    with open(config_path, 'w', encoding='utf-8') as f:
-        yaml.dump(config, f, default_flow_style=False, allow_unicode=True)
-
-    print(f"✅ 创建全局配置: {config_path}")
+    if dump_yaml_config(config, config_path):
+        print(f"✅ 创建全局配置: {config_path}")
+    else:
+        print(f"✅ 全局配置未变化: {config_path}")
 
 def create_agent_configs():
     """创建智能体配置文件"""
 
     # 基督教文化智能体配置
     christian_config = {
-        "model": {
-            "model_id": "meta-llama/Meta-Llama-3-8B-Instruct",
-            "cache_dir": "./cache",
-            "torch_dtype": "bfloat16",
-            "device_map": "auto",
-            "max_new_tokens": 512,
-            "temperature": 0.0,
-            "max_input_length": 2048
-        },
+        "model": {"model_id": LLAMA3_MODEL_ID, **MODEL_DEFAULTS, **GENERATION_DEFAULTS},
         "cultural": {
             "cultural_values": ["个人自由", "人权", "平等", "民主", "个人责任"],
             "social_norms": {
@@ -83,15 +103,7 @@ def create_agent_configs():
 
     # 伊斯兰文化智能体配置
     islamic_config = {
-        "model": {
-            "model_id": "meta-llama/Meta-Llama-3-8B-Instruct",
-            "cache_dir": "./cache",
-            "torch_dtype": "bfloat16",
-            "device_map": "auto",
-            "max_new_tokens": 512,
-            "temperature": 0.0,
-            "max_input_length": 2048
-        },
+        "model": {"model_id": LLAMA3_MODEL_ID, **MODEL_DEFAULTS, **GENERATION_DEFAULTS},
         "cultural": {
             "cultural_values": ["谦逊", "敬畏", "家庭责任", "社会秩序", "诚实"],
             "social_norms": {
@@ -116,15 +128,15 @@ def create_agent_configs():
     # 其他文化智能体配置（简化版）
     other_configs = {
         "cultural_buddhist": {
-            "model": {"model_id": "google/gemma-2-9b-it", "cache_dir": "./cache", "torch_dtype": "bfloat16"},
+            "model": {"model_id": GEMMA2_MODEL_ID, **MODEL_DEFAULTS},
             "cultural": {"cultural_values": ["内心平静", "慈悲", "简朴", "和谐"]}
         },
         "cultural_hindu": {
-            "model": {"model_id": "meta-llama/Meta-Llama-3-8B-Instruct", "cache_dir": "./cache", "torch_dtype": "bfloat16"},
+            "model": {"model_id": LLAMA3_MODEL_ID, **MODEL_DEFAULTS},
             "cultural": {"cultural_values": ["达摩", "家庭责任", "精神修养", "传统仪式"]}
         },
         "cultural_traditional": {
-            "model": {"model_id": "meta-llama/Meta-Llama-3-8B-Instruct", "cache_dir": "./cache", "torch_dtype": "bfloat16"},
+            "model": {"model_id": LLAMA3_MODEL_ID, **MODEL_DEFAULTS},
             "cultural": {"cultural_values": ["自然和谐", "祖先崇拜", "部落团结", "传统智慧"]}
         }
     }
@@ -138,9 +150,10 @@ def create_agent_configs():
 
     for agent_type, config in configs.items():
         config_path = Path(f"config/{agent_type}_config.yaml")
-        with open(config_path, 'w', encoding='utf-8') as f:
-            yaml.dump(config, f, default_flow_style=False, allow_unicode=True)
-        print(f"✅ 创建智能体配置: {config_path}")
+        if dump_yaml_config(config, config_path):
+            print(f"✅ 创建智能体配置: {config_path}")
+        else:
+            print(f"✅ 智能体配置未变化: {config_path}")
 
 def create_run_script():
     """创建运行脚本"""
@@ -183,8 +196,9 @@ echo "✅ 处理完成！结果保存在 output/multi_agent_results.jsonl"
 '''
 
     script_path = Path("run_inference.sh")
-    with open(script_path, 'w') as f:
-        f.write(script_content)
+    if not write_if_changed(script_path, script_content.encode('utf-8')):
+        print(f"✅ 运行脚本未变化: {script_path}")
+        return
 
     # 设置执行权限
     os.chmod(script_path, 0o755)
@@ -16,6 +16,12 @@ logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
 # 创建模拟的智能体类，避免加载真实模型
 class MockCulturalAgent:
+    # 各阶段的固定响应，未知阶段按最终决策处理
+    STAGE_RESPONSES = {
+        "initial_decision": "Yes. This behavior is socially acceptable.",
+        "feedback": "I agree with the previous assessment."
+    }
+
     def __init__(self, agent_id, agent_type, config):
         self.agent_id = agent_id
         self.agent_type = agent_type
@@ -33,12 +39,7 @@ class MockCulturalAgent:
         content = message.content
         stage = content.get("context", {}).get("stage", "initial_decision")
 
-        if stage == "initial_decision":
-            response_text = "Yes. This behavior is socially acceptable."
-        elif stage == "feedback":
-            response_text = "I agree with the previous assessment."
-        else:  # final_decision
-            response_text = "Yes"
+        response_text = self.STAGE_RESPONSES.get(stage, "Yes")
 
         return AgentResponse(
             agent_id=self.agent_id,
@@ -49,10 +50,7 @@ class MockCulturalAgent:
         )
 
     def parse_response(self, response_text, stage):
-        if stage == "final_decision":
-            answer = "yes" if "yes" in response_text.lower() else "no"
-        else:
-            answer = "yes" if "yes" in response_text.lower() else "no"
+        answer = "yes" if "yes" in response_text.lower() else "no"
 
         return {
             "answer": answer,
@@ -163,12 +161,9 @@ async def test_normad_processing():
             "cultural_traditional": "yes"
         }
 
-        # 计算多数决策
-        answer_counts = {}
-        for answer in agent_decisions.values():
-            answer_counts[answer] = answer_counts.get(answer, 0) + 1
-
-        majority_decision = max(answer_counts, key=answer_counts.get)
+        # 计算多数决策（与推理脚本使用同一实现）
+        from run_multi_agent_inference import calculate_majority_decision
+        majority_decision = calculate_majority_decision(agent_decisions)
 
         print(f"✅ 多数决策: {majority_decision}, 金标准: {scenario['gold_label']}")
         print(f"✅ 准确性: {'正确' if majority_decision == scenario['gold_label'] else '错误'}")
@@ -9,11 +9,21 @@ import time
 import tempfile
 import shutil
 from pathlib import Path
+from types import SimpleNamespace
+
+import torch
 
 from agents.base.agent_interface import AgentType, AgentMessage, AgentStatus
 from agents.base.base_agent import BaseAgent
+from agents.base import model_registry
+from agents.base.model_batcher import ModelBatcher
+from agents.base.model_registry import ModelRegistry
+from agents.cultural import cultural_agent_base
+from agents.cultural.christian_agent import ChristianCulturalAgent
+from agents.cultural.cultural_agent_base import KeywordScanner
 from agents.utils.agent_pool import AgentPool
 from agents.utils.message_bus import MessageBus
+from agents.utils.response_cache import ResponseCache
 from config.agent_config import AgentConfigManager
 
 
@@ -25,14 +35,87 @@ class MockAgent(BaseAgent):
         return True
 
     async def generate_response(self, prompt: str, context: dict) -> str:
-        await asyncio.sleep(0.1)  # 模拟处理时间
+        # 默认只让出一次事件循环；需要模拟处理时间的测试通过response_delay配置
+        await asyncio.sleep(self.config.get("response_delay", 0))
         return f"Mock response to: {prompt}"
 
     async def cleanup(self) -> bool:
+        await self._stop_inbox()
         self.set_status(AgentStatus.INACTIVE)
         return True
 
 
+class SlowBatcher(ModelBatcher):
+    """测试用的批处理器，每个批次都长时间处理"""
+
+    async def _process_batch(self, batch, generate=None):
+        await asyncio.sleep(10.0)
+
+
+class RecordingBatcher(ModelBatcher):
+    """测试用的批处理器，记录每次generate的批次，生成结果为带前缀的prompt"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches = []
+
+    def _generate_batch(self, batch):
+        self.batches.append([request.prompt for request in batch])
+        return [f"out:{request.prompt}" for request in batch]
+
+
+class FakePretrained:
+    """测试用的from_pretrained替身，记录加载次数"""
+    loads = 0
+
+    @classmethod
+    def from_pretrained(cls, model_id, **kwargs):
+        FakePretrained.loads += 1
+        return SimpleNamespace(model_id=model_id, eval=lambda: None)
+
+
+class MergingTokenizer:
+    """测试用的tokenizer，按最长匹配切分，"ab"会合并为一个token，开头添加BOS"""
+    vocab = {"<s>": 0, "ab": 1}
+    eos_token_id = 2
+
+    def __call__(self, text, return_tensors=None, add_special_tokens=True, truncation=False, max_length=None):
+        ids = [self.vocab["<s>"]] if add_special_tokens else []
+        i = 0
+        while i < len(text):
+            if text.startswith("ab", i):
+                ids.append(self.vocab["ab"])
+                i += 2
+            else:
+                ids.append(1000 + ord(text[i]))
+                i += 1
+        if truncation and max_length:
+            ids = ids[:max_length]
+        return SimpleNamespace(input_ids=torch.tensor([ids]))
+
+
+class PrefixAgent(BaseAgent):
+    """测试用的智能体，使用固定的静态前缀"""
+
+    def _get_system_prefix(self) -> str:
+        return self.config["prefix"]
+
+
+class RecordingSubmitter:
+    """测试用的批处理器替身，记录提交方式和输入"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def submit(self, prompt, gen_kwargs, max_length):
+        self.calls.append(("submit", prompt, None))
+        return "ok"
+
+    async def submit_cached(self, input_ids, past_key_values, gen_kwargs):
+        self.calls.append(("submit_cached", input_ids.tolist(), past_key_values))
+        return "ok"
+
+
 @pytest.fixture
 async def temp_config_dir():
     """临时配置目录"""
@@ -137,6 +220,254 @@ class TestAgentInterface:
 
         await agent.cleanup()
 
+    @pytest.mark.asyncio
+    async def test_inbox_backpressure(self):
+        """测试收件箱满时的丢弃处理"""
+        config = {"model_id": "test_model", "inbox_size": 1, "enqueue_timeout": 0.01, "response_delay": 0.1,
+                  "max_inflight_messages": 1}
+        agent = MockAgent("test_agent", AgentType.CULTURAL_CHRISTIAN, config)
+        await agent.initialize()
+
+        messages = [
+            AgentMessage(
+                sender_id="sender",
+                receiver_id="test_agent",
+                message_type="generate_response",
+                content={"prompt": f"prompt_{i}", "context": {}},
+                timestamp=time.time(),
+                conversation_id="test_conv"
+            )
+            for i in range(4)
+        ]
+
+        results = await asyncio.gather(
+            *[agent.submit_message(message) for message in messages],
+            return_exceptions=True
+        )
+        assert "Mock response" in results[0].response_text
+        assert any(isinstance(result, RuntimeError) for result in results)
+
+        await agent.cleanup()
+
+    @pytest.mark.asyncio
+    async def test_inbox_processes_messages_concurrently(self):
+        """测试收件箱中的消息并发处理"""
+        config = {"model_id": "test_model", "response_delay": 0.2, "max_inflight_messages": 4}
+        agent = MockAgent("test_agent", AgentType.CULTURAL_CHRISTIAN, config)
+        await agent.initialize()
+
+        messages = [
+            AgentMessage(
+                sender_id="sender",
+                receiver_id="test_agent",
+                message_type="generate_response",
+                content={"prompt": f"prompt_{i}", "context": {}},
+                timestamp=time.time(),
+                conversation_id="test_conv"
+            )
+            for i in range(4)
+        ]
+
+        start = time.monotonic()
+        responses = await asyncio.gather(*[agent.submit_message(message) for message in messages])
+        assert time.monotonic() - start < 0.6
+        assert [r.response_text for r in responses] == [f"Mock response to: prompt_{i}" for i in range(4)]
+
+        await agent.cleanup()
+
+    @pytest.mark.asyncio
+    async def test_cleanup_fails_pending_messages(self):
+        """测试清理时处理中和排队中的消息都会失败，调用方不会一直等待"""
+        config = {"model_id": "test_model", "response_delay": 10.0, "max_inflight_messages": 1}
+        agent = MockAgent("test_agent", AgentType.CULTURAL_CHRISTIAN, config)
+        await agent.initialize()
+
+        tasks = [
+            asyncio.create_task(agent.submit_message(AgentMessage(
+                sender_id="sender",
+                receiver_id="test_agent",
+                message_type="generate_response",
+                content={"prompt": f"prompt_{i}", "context": {}},
+                timestamp=time.time(),
+                conversation_id="test_conv"
+            )))
+            for i in range(2)
+        ]
+        await asyncio.sleep(0.05)
+
+        await agent.cleanup()
+        results = await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), 1.0)
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+
+class TestModelBatcher:
+    """测试模型批处理器"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_are_batched(self):
+        """测试并发请求合并为一次generate，生成参数不同的请求分开处理"""
+        tokenizer = SimpleNamespace(pad_token=None, eos_token="</s>")
+        batcher = RecordingBatcher(("mock_model", "bfloat16", "cpu", "bf16", "sdpa", False), None, tokenizer, "cpu", max_batch_size=8, max_wait_ms=20)
+
+        results = await asyncio.gather(
+            batcher.submit("a", {"max_new_tokens": 8}, 16),
+            batcher.submit("b", {"max_new_tokens": 8}, 16),
+            batcher.submit("c", {"max_new_tokens": 4}, 16),
+        )
+        await batcher.stop()
+
+        assert results == ["out:a", "out:b", "out:c"]
+        assert sorted(batcher.batches) == [["a", "b"], ["c"]]
+        assert tokenizer.pad_token == "</s>"
+
+    @pytest.mark.asyncio
+    async def test_stop_fails_pending_requests(self):
+        """测试停止时正在处理和仍在队列中的请求都会失败"""
+        tokenizer = SimpleNamespace(pad_token=None, eos_token="</s>")
+        batcher = SlowBatcher(("mock_model", "bfloat16", "cpu", "bf16", "sdpa", False), None, tokenizer, "cpu", max_batch_size=1, max_wait_ms=0)
+
+        tasks = [asyncio.ensure_future(batcher.submit(f"prompt_{i}", {}, 16)) for i in range(3)]
+        await asyncio.sleep(0.05)
+
+        await batcher.stop()
+        results = await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), 1.0)
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+
+class TestPrefixCache:
+    """测试静态前缀缓存的复用"""
+
+    @staticmethod
+    def make_agent(prefix):
+        agent = PrefixAgent("prefix_agent", AgentType.CULTURAL_CHRISTIAN, {"model_id": "mock_model", "prefix": prefix})
+        agent.model = object()
+        agent.tokenizer = MergingTokenizer()
+        agent.batcher = RecordingSubmitter()
+        agent._prefix_cache[prefix] = (agent.tokenizer(prefix, return_tensors="pt").input_ids, "prefix_kv")
+        return agent
+
+    @pytest.mark.asyncio
+    async def test_cached_ids_match_whole_prompt_tokenization(self):
+        """测试复用前缀时的输入与整个prompt一次tokenize的结果一致"""
+        agent = self.make_agent("xy:")
+
+        await agent.generate_response("abc", {})
+
+        expected = agent.tokenizer("xy:abc", return_tensors="pt").input_ids.tolist()
+        assert agent.batcher.calls == [("submit_cached", expected, "prefix_kv")]
+
+    @pytest.mark.asyncio
+    async def test_merge_across_boundary_falls_back(self):
+        """测试BPE在前缀边界处合并时不复用前缀，改为整体提交"""
+        agent = self.make_agent("xa")
+
+        await agent.generate_response("bc", {})
+
+        assert agent.batcher.calls == [("submit", "xabc", None)]
+
+    @pytest.mark.asyncio
+    async def test_prompt_truncated_to_prefix_does_not_reuse_kv(self):
+        """测试截断后只剩前缀时不复用KV缓存，保证至少有一个token需要prefill"""
+        agent = self.make_agent("xy:")
+        agent.max_input_length = 4
+
+        await agent.generate_response("abc", {})
+
+        assert agent.batcher.calls == [("submit", "xy:abc", None)]
+
+
+class TestModelRegistry:
+    """测试模型注册表"""
+
+    @pytest.fixture
+    def fake_loaders(self, monkeypatch):
+        FakePretrained.loads = 0
+        monkeypatch.setattr(model_registry, "AutoTokenizer", FakePretrained)
+        monkeypatch.setattr(model_registry, "AutoModelForCausalLM", FakePretrained)
+        yield
+        ModelRegistry._models.clear()
+        ModelRegistry._ref_counts.clear()
+
+    def test_shared_model_is_loaded_once(self, fake_loaders):
+        """测试相同配置的模型只加载一次，引用计数归零时才移除"""
+        key = ("mock_model", "bfloat16", "cpu", "bf16", "sdpa", False)
+
+        first = ModelRegistry.acquire(key)
+        second = ModelRegistry.acquire(key)
+        assert first is second
+        assert FakePretrained.loads == 2  # tokenizer和模型各加载一次
+        assert ModelRegistry.get_ref_count(key) == 2
+
+        assert ModelRegistry.release(key) is False
+        assert ModelRegistry.release(key) is True
+        assert ModelRegistry.get_ref_count(key) == 0
+        assert ModelRegistry.release(key) is False
+
+    def test_different_keys_load_separately(self, fake_loaders):
+        """测试配置不同的模型分别加载"""
+        key_bf16 = ("mock_model", "bfloat16", "cpu", "bf16", "sdpa", False)
+        key_eager = ("mock_model", "bfloat16", "cpu", "bf16", "eager", False)
+
+        assert ModelRegistry.acquire(key_bf16) is not ModelRegistry.acquire(key_eager)
+        assert FakePretrained.loads == 4
+
+
+class TestAnswerParsing:
+    """测试文化智能体的答案解析"""
+
+    @pytest.fixture
+    def agent(self):
+        return ChristianCulturalAgent("christian", AgentType.CULTURAL_CHRISTIAN, {"model_id": "test_model"})
+
+    @pytest.mark.parametrize("response, expected", [
+        ("No doubt about it, the answer is yes.", "yes"),
+        ("Answer: No\nYes, some people might disagree.", "no"),
+        ("**Answer:** Neither", "neither"),
+        ("最终答案：No", "no"),
+        ("I don't know.", "neither"),
+        ("Not sure, nothing stands out.", "neither"),
+    ])
+    def test_final_answer(self, agent, response, expected):
+        """测试最终答案解析：标签后的答案优先，否则按 yes > no > neither 选取"""
+        assert agent.parse_response(response, "final_decision")["answer"] == expected
+
+    def test_detailed_response_prefers_labelled_line(self, agent):
+        """测试详细回答优先使用带标签的答案行，其余行作为解释"""
+        response = "No doubt this is a common situation.\nAnswer: Yes\nGuests usually bring gifts."
+        parsed = agent.parse_response(response, "initial_decision")
+        assert parsed["answer"] == "yes"
+        assert parsed["explanation"] == "No doubt this is a common situation.\nGuests usually bring gifts."
+
+    def test_detailed_response_without_label(self, agent):
+        """测试没有标签时取第一行出现答案的行"""
+        parsed = agent.parse_response("No doubt, yes.\nIt is polite.", "initial_decision")
+        assert parsed["answer"] == "yes"
+        assert parsed["explanation"] == "It is polite."
+
+
+class TestKeywordScanner:
+    """测试关键词扫描器"""
+
+    CATEGORIES = {
+        "food": ["pork", "pork chop"],
+        "cooking": ["chop"],
+        "drink": ["alcohol"],
+    }
+
+    def test_overlapping_keywords(self):
+        """测试相互重叠的关键词都能被找到"""
+        scanner = KeywordScanner(self.CATEGORIES)
+        assert scanner.scan("he ate a pork chop with alcohol") == frozenset({"food", "cooking", "drink"})
+        assert scanner.scan("he ate pork") == frozenset({"food"})
+        assert scanner.scan("nothing relevant") == frozenset()
+
+    def test_regex_fallback(self, monkeypatch):
+        """测试未安装pyahocorasick时的正则扫描结果一致"""
+        monkeypatch.setattr(cultural_agent_base, "ahocorasick", None)
+        scanner = KeywordScanner(self.CATEGORIES)
+        assert scanner.scan("he ate a pork chop with alcohol") == frozenset({"food", "cooking", "drink"})
+        assert scanner.scan("chop") == frozenset({"cooking"})
+
 
 class TestAgentPool:
     """测试智能体池"""
@@ -196,6 +527,37 @@ class TestAgentPool:
         assert len(agent_pool.active_agents) == 2
         assert agent1.status == AgentStatus.INACTIVE  # 应该被驱逐
 
+    @pytest.mark.asyncio
+    async def test_preloaded_agents_are_pinned(self, agent_pool):
+        """测试预加载的智能体不会被LRU驱逐"""
+        for agent_type in (AgentType.CULTURAL_ISLAMIC, AgentType.CULTURAL_BUDDHIST):
+            agent_pool.register_agent_class(agent_type, MockAgent, {"model_id": "mock_model"})
+
+        loaded = await agent_pool.preload([AgentType.CULTURAL_CHRISTIAN, AgentType.CULTURAL_ISLAMIC])
+        assert loaded == 2
+
+        # 池已满且全部常驻，加载新的智能体时不驱逐常驻智能体
+        agent3 = await agent_pool.get_agent(AgentType.CULTURAL_BUDDHIST)
+        assert agent3 is not None
+        assert len(agent_pool.active_agents) == 3
+        assert all(agent.status == AgentStatus.ACTIVE for agent in agent_pool.active_agents.values())
+
+    @pytest.mark.asyncio
+    async def test_preload_respects_max_active_agents(self, agent_pool):
+        """测试预加载数量不超过max_active_agents"""
+        agent_types = [AgentType.CULTURAL_CHRISTIAN, AgentType.CULTURAL_ISLAMIC, AgentType.CULTURAL_BUDDHIST]
+        for agent_type in agent_types[1:]:
+            agent_pool.register_agent_class(agent_type, MockAgent, {"model_id": "mock_model"})
+
+        # 放不下全部类型时留出一个位置轮换其余智能体
+        loaded = await agent_pool.preload(agent_types)
+        assert loaded == 1
+        assert agent_pool.max_active_agents == 2
+
+        for agent_type in agent_types[1:]:
+            assert await agent_pool.get_agent(agent_type) is not None
+            assert len(agent_pool.active_agents) <= agent_pool.max_active_agents
+
     @pytest.mark.asyncio
     async def test_health_check(self, agent_pool):
         """测试健康检查"""
@@ -292,6 +654,30 @@ class TestMessageBus:
         assert receiver_queue.get("queue_size", 0) <= receiver_queue.get("max_size", 100)
 
 
+    @pytest.mark.asyncio
+    async def test_expired_messages_are_removed(self):
+        """测试超过message_timeout未被接收的消息由后台任务清理"""
+        bus = MessageBus({"max_queue_size": 100, "message_timeout": 0.05})
+        await bus.start()
+        try:
+            message = AgentMessage(
+                sender_id="sender",
+                receiver_id="receiver",
+                message_type="test",
+                content={"data": "test"},
+                timestamp=time.time(),
+                conversation_id="test_conv"
+            )
+            await bus.send_message(message)
+            assert bus.get_queue_status()["receiver"]["queue_size"] == 1
+
+            await asyncio.sleep(0.2)
+            assert bus.get_queue_status()["receiver"]["queue_size"] == 0
+            assert not bus.expiry_index
+        finally:
+            await bus.stop()
+
+
 class TestConfigManager:
     """测试配置管理器"""
 
@@ -334,6 +720,108 @@ class TestConfigManager:
         imported_config = new_config_manager.get_global_config()
         assert "test_key" not in imported_config  # 应该是导出时的原始配置
 
+        # 导入后的智能体配置应与导出时一致
+        original = config_manager.get_agent_config(AgentType.CULTURAL_CHRISTIAN)
+        imported = new_config_manager.get_agent_config(AgentType.CULTURAL_CHRISTIAN)
+        assert imported.model_config == original.model_config
+        assert imported.cultural_config == original.cultural_config
+
+    def test_config_export_import_json(self, config_manager, temp_config_dir):
+        """测试以JSON格式导出导入配置"""
+        export_file = Path(temp_config_dir) / "exported_config.json"
+        config_manager.export_config(str(export_file))
+
+        new_dir = temp_config_dir + "_json"
+        try:
+            new_config_manager = AgentConfigManager(new_dir)
+            new_config_manager.import_config(str(export_file))
+            for agent_type in config_manager.get_all_agent_types():
+                assert new_config_manager.get_agent_config(agent_type) == config_manager.get_agent_config(agent_type)
+        finally:
+            shutil.rmtree(new_dir, ignore_errors=True)
+
+    def test_agent_config_update_roundtrip(self, config_manager, temp_config_dir):
+        """测试智能体配置更新后重新加载不丢失"""
+        config_manager.update_agent_config(
+            AgentType.CULTURAL_BUDDHIST, {"model_config": {"max_new_tokens": 64}}
+        )
+        config_manager.update_agent_config(
+            AgentType.CULTURAL_CHRISTIAN, {"cultural_config": {"cultural_values": ["测试"]}}
+        )
+
+        reloaded = AgentConfigManager(temp_config_dir)
+        buddhist = reloaded.get_agent_config(AgentType.CULTURAL_BUDDHIST)
+        assert buddhist.model_config.max_new_tokens == 64
+        assert buddhist.model_config.model_id == "google/gemma-2-9b-it"
+
+        christian = reloaded.get_agent_config(AgentType.CULTURAL_CHRISTIAN)
+        assert christian.cultural_config.cultural_values == ["测试"]
+        assert christian.cultural_config.social_norms
+
+
+class TestResponseCache:
+    """测试回应缓存"""
+
+    @pytest.mark.asyncio
+    async def test_cancelled_creator_does_not_fail_waiters(self):
+        """测试生成请求被取消时，等待相同结果的请求重新生成而不是收到CancelledError"""
+        cache = ResponseCache()
+        calls = []
+
+        async def factory():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return f"response_{len(calls)}"
+
+        creator = asyncio.ensure_future(cache.get_or_create("key", factory))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.ensure_future(cache.get_or_create("key", factory))
+        await asyncio.sleep(0.01)
+
+        creator.cancel()
+        assert await waiter == "response_2"
+        assert creator.cancelled()
+        assert len(calls) == 2
+        assert len(cache) == 1
+
+    @pytest.mark.asyncio
+    async def test_hit_miss_and_lru_eviction(self):
+        """测试命中统计和超出容量时淘汰最久未使用的结果"""
+        cache = ResponseCache(max_size=2)
+
+        async def factory(value):
+            return value
+
+        assert await cache.get_or_create("a", lambda: factory("A")) == "A"
+        assert await cache.get_or_create("b", lambda: factory("B")) == "B"
+        assert await cache.get_or_create("a", lambda: factory("X")) == "A"  # 命中，a变为最近使用
+        await cache.get_or_create("c", lambda: factory("C"))  # 淘汰b
+
+        assert len(cache) == 2
+        assert await cache.get_or_create("b", lambda: factory("B2")) == "B2"
+        assert cache.hits == 1
+        assert cache.misses == 4
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_one_call(self):
+        """测试并发的相同请求只调用一次factory，失败的结果不缓存"""
+        cache = ResponseCache()
+        calls = []
+
+        async def failing():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise ValueError("generation failed")
+
+        results = await asyncio.gather(
+            cache.get_or_create("key", failing),
+            cache.get_or_create("key", failing),
+            return_exceptions=True
+        )
+        assert all(isinstance(result, ValueError) for result in results)
+        assert len(calls) == 1
+        assert len(cache) == 0
+
 
 class TestIntegration:
     """集成测试"""